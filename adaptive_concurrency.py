@@ -0,0 +1,122 @@
+"""
+Réglage automatique du nombre de requêtes simultanées vers ADE.
+
+Contrôleur AIMD (augmentation additive, diminution multiplicative) : tant
+que le 95e centile des latences reste sous la cible et que les erreurs sont
+rares, la concurrence augmente d'une unité par fenêtre d'observations ; dès
+que des délais dépassés ou des erreurs serveur apparaissent, elle est
+divisée par deux.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveConcurrency:
+    """
+    Contrôleur AIMD de la concurrence, alimenté par les latences observées.
+
+    Args:
+        initial (int): Concurrence de départ
+        minimum (int): Concurrence minimale
+        maximum (int): Concurrence maximale
+        target_p95 (float): Latence cible du 95e centile, en secondes
+        max_error_rate (float): Taux d'erreur toléré pour continuer à augmenter
+        window (int): Nombre d'observations entre deux ajustements
+        log_interval (float): Intervalle entre deux lignes de journal, en secondes
+        fixed (bool): Désactive l'ajustement (la concurrence reste `initial`)
+    """
+
+    def __init__(self, initial=10, minimum=1, maximum=64, target_p95=2.0, max_error_rate=0.02,
+                 window=50, log_interval=30.0, fixed=False):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_p95 = target_p95
+        self.max_error_rate = max_error_rate
+        self.window = window
+        self.log_interval = log_interval
+        self.fixed = fixed
+        self._limit = float(max(minimum, min(maximum, initial)))
+        self._latencies = []
+        self._errors = 0
+        self._completed = 0
+        # Nombre d'observations au moment de la dernière division par deux
+        self._decreased_at = None
+        self._started = time.monotonic()
+        self._last_log = self._started
+        self._completed_at_last_log = 0
+        self._last_p95 = None
+        self.history = []
+        self.lock = threading.Lock()
+
+    @property
+    def limit(self):
+        """Nombre de requêtes simultanées autorisées en ce moment."""
+        return int(self._limit)
+
+    def record(self, latency, ok=True):
+        """
+        Enregistre une requête terminée.
+
+        Args:
+            latency (float): Durée de l'aller-retour HTTP, en secondes
+            ok (bool): False pour un délai dépassé ou une erreur serveur
+        """
+        with self.lock:
+            self._completed += 1
+            self._latencies.append(latency)
+            if not ok:
+                self._errors += 1
+                # Diminution immédiate, au plus une fois par fenêtre : les
+                # erreurs d'une même rafale ne divisent la concurrence qu'une fois
+                if not self.fixed and (self._decreased_at is None
+                                       or self._completed - self._decreased_at >= self.window):
+                    self._limit = max(self.minimum, self._limit / 2)
+                    self._decreased_at = self._completed
+                    self._reset_window()
+                    return
+            if len(self._latencies) >= self.window:
+                self._adjust()
+        self.maybe_log()
+
+    def _reset_window(self):
+        self._latencies = []
+        self._errors = 0
+
+    def _adjust(self):
+        latencies = sorted(self._latencies)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        error_rate = self._errors / len(latencies)
+        self._last_p95 = p95
+        if not self.fixed:
+            if p95 <= self.target_p95 and error_rate <= self.max_error_rate:
+                self._limit = min(self.maximum, self._limit + 1)
+            elif p95 > self.target_p95:
+                self._limit = max(self.minimum, self._limit * 0.9)
+        self._reset_window()
+
+    def summary(self):
+        """Concurrence actuelle et dernier 95e centile des latences."""
+        p95 = f"{self._last_p95:.2f} s" if self._last_p95 is not None else "n/a"
+        return f"Concurrence: {self.limit} - Latence p95: {p95}"
+
+    def maybe_log(self, force=False):
+        """Journalise la concurrence et le débit si `log_interval` est écoulé."""
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self._last_log < self.log_interval:
+                return
+            throughput = (self._completed - self._completed_at_last_log) / max(now - self._last_log, 1e-9)
+            self._last_log = now
+            self._completed_at_last_log = self._completed
+            p95 = self._last_p95
+            self.history.append({
+                "elapsed": round(now - self._started, 1),
+                "concurrency": self.limit,
+                "throughput": round(throughput, 2),
+                "p95": p95,
+            })
+        p95_text = f"{p95:.2f} s" if p95 is not None else "n/a"
+        logger.debug("Concurrence: %s - Débit: %.1f codes/s - Latence p95: %s", self.limit, throughput, p95_text)
@@ -0,0 +1,196 @@
+"""
+Cache local (SQLite) des réponses d'ADE.
+
+Les calendriers sont rangés par (resources, firstDate, lastDate, projectId),
+compressés avec zlib et datés. Une entrée expire après `ttl` secondes ; au
+delà de `max_bytes` de données compressées, les entrées les moins récemment
+lues sont supprimées. En mode hors ligne, le client ne sert que le cache,
+même expiré, et n'envoie aucune requête à ADE.
+
+    python ade_cache.py [--cache ade_cache.sqlite] [--purge-expired] [--clear]
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from ade_governor import ADEUnavailableError
+
+DEFAULT_CACHE = "ade_cache.sqlite"
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+
+
+def cache_key(params):
+    """Clé de cache d'une requête `anonymous_cal.jsp`."""
+    return (str(params["resources"]), str(params["firstDate"]), str(params["lastDate"]), str(params["projectId"]))
+
+
+class ResponseCache:
+    """
+    Cache des réponses ADE, utilisable depuis plusieurs threads.
+
+    Args:
+        path (str): Fichier SQLite du cache
+        ttl (float): Durée de validité d'une réponse, en secondes
+        max_bytes (int): Taille maximale des réponses compressées
+        offline (bool): Ne sert que le cache, sans jamais interroger ADE
+    """
+
+    def __init__(self, path=DEFAULT_CACHE, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                resources TEXT, first_date TEXT, last_date TEXT, project_id TEXT,
+                body BLOB, size INTEGER, fetched_at REAL, last_access REAL,
+                PRIMARY KEY (resources, first_date, last_date, project_id)
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, params):
+        """
+        Retourne le calendrier en cache pour ces paramètres, ou None s'il est
+        absent ou expiré (les entrées expirées restent servies hors ligne).
+        """
+        key = cache_key(params)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT body, fetched_at FROM responses "
+                "WHERE resources = ? AND first_date = ? AND last_date = ? AND project_id = ?", key
+            ).fetchone()
+            if row is None or (not self.offline and now - row[1] > self.ttl):
+                return None
+            self.db.execute(
+                "UPDATE responses SET last_access = ? "
+                "WHERE resources = ? AND first_date = ? AND last_date = ? AND project_id = ?", (now,) + key
+            )
+            self.db.commit()
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, params, text):
+        """Enregistre un calendrier, puis évince les entrées les plus anciennes si besoin."""
+        self._store(params, zlib.compress(text.encode("utf-8")))
+
+    def writer(self, params):
+        """
+        `PendingResponse` qui compresse un calendrier au fil de son
+        téléchargement ; il n'est enregistré qu'à l'appel de `commit`.
+        """
+        return PendingResponse(self, params)
+
+    def _store(self, params, body):
+        key = cache_key(params)
+        now = time.time()
+        with self.lock:
+            old = self.db.execute(
+                "SELECT size FROM responses "
+                "WHERE resources = ? AND first_date = ? AND last_date = ? AND project_id = ?", key
+            ).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            key + (body, len(body), now, now))
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        # Suppression des entrées les moins récemment lues jusqu'à repasser sous la limite
+        while self.total_bytes > self.max_bytes:
+            rows = self.db.execute(
+                "SELECT rowid, size FROM responses ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for rowid, size in rows:
+                self.db.execute("DELETE FROM responses WHERE rowid = ?", (rowid,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def purge_expired(self):
+        """Supprime les entrées expirées et retourne leur nombre."""
+        with self.lock:
+            cursor = self.db.execute("DELETE FROM responses WHERE fetched_at < ?", (time.time() - self.ttl,))
+            self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self.db.commit()
+        return cursor.rowcount
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.total_bytes = 0
+            self.db.commit()
+
+    def stats(self):
+        """Nombre d'entrées, taille compressée et nombre d'entrées expirées."""
+        with self.lock:
+            count, expired = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(fetched_at < ?), 0) FROM responses", (time.time() - self.ttl,)
+            ).fetchone()
+        return {"entries": count, "bytes": self.total_bytes, "expired": expired}
+
+    def close(self):
+        self.db.close()
+
+
+class PendingResponse:
+    """
+    Calendrier en cours de téléchargement, compressé morceau par morceau
+    (octets UTF-8) : seule sa version compressée est gardée en mémoire.
+    """
+
+    def __init__(self, cache, params):
+        self.cache = cache
+        self.params = params
+        self._compressor = zlib.compressobj()
+        self._parts = []
+
+    def write(self, chunk):
+        self._parts.append(self._compressor.compress(chunk))
+
+    def commit(self):
+        """Enregistre le calendrier complet dans le cache."""
+        self._parts.append(self._compressor.flush())
+        self.cache._store(self.params, b"".join(self._parts))
+        self._parts = []
+
+
+class OfflineCacheMiss(ADEUnavailableError):
+    """Réponse absente du cache alors que le client est hors ligne."""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance du cache local des réponses ADE.")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="Fichier SQLite du cache")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="Durée de validité, en secondes")
+    parser.add_argument("--purge-expired", action="store_true", help="Supprime les entrées expirées")
+    parser.add_argument("--clear", action="store_true", help="Vide le cache")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.cache):
+        print(f"Cache non trouvé: {args.cache}")
+        return
+
+    cache = ResponseCache(args.cache, ttl=args.ttl)
+    if args.clear:
+        cache.clear()
+    elif args.purge_expired:
+        print(f"{cache.purge_expired()} entrées expirées supprimées")
+    stats = cache.stats()
+    print(f"{stats['entries']} entrées ({stats['bytes'] / 1024 / 1024:.1f} Mo compressés), "
+          f"dont {stats['expired']} expirées")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
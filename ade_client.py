@@ -0,0 +1,511 @@
+"""
+Client partagé pour l'accès à ADE (adeconsult.app.u-paris.fr).
+
+Toutes les requêtes passent par une même session HTTP avec un pool de
+connexions persistantes (keep-alive), ce qui évite de repayer la poignée de
+main TCP+TLS à chaque calendrier. Une API asyncio (`fetch_many`) permet de
+lancer plusieurs centaines de requêtes simultanées sur une seule boucle
+d'événements. Le trafic est régulé par `ade_governor` (limite de débit
+globale, nouvelles tentatives, disjoncteur) et peut être servi par un
+cache local (`ade_cache`, voir `configure_cache`).
+"""
+import asyncio
+import datetime
+import itertools
+import os
+import stat
+import tempfile
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp est optionnel, on retombe sur des threads
+    aiohttp = None
+
+from ade_cache import ResponseCache, OfflineCacheMiss, DEFAULT_CACHE, DEFAULT_TTL, DEFAULT_MAX_BYTES
+from ade_governor import get_governor, ADEUnavailableError, TransientError, RETRY_STATUSES
+from ade_ics import split_calendar, join_calendar, merge_calendars, event_start_date, demultiplex
+
+ADE_URL = "https://adeconsult.app.u-paris.fr/jsp/custom/modules/plannings/anonymous_cal.jsp"
+DEFAULT_START = "2024-08-23"
+DEFAULT_END = "2025-07-17"
+DEFAULT_YEAR = 5
+FICHE_ETALON = "58598,"
+
+# Semaines de cours chargées (un par semestre) utilisées pour sonder un code
+PROBE_WINDOWS = [("2024-10-07", "2024-10-18"), ("2025-02-03", "2025-02-14")]
+
+
+def build_params(code, start=DEFAULT_START, end=DEFAULT_END, year=DEFAULT_YEAR, fiche_etalon=FICHE_ETALON):
+    """
+    Construit les paramètres de la requête `anonymous_cal.jsp` pour un code.
+    """
+    return {
+        "calType": "ical",
+        "firstDate": start,
+        "lastDate": end,
+        "resources": fiche_etalon + str(code),
+        "projectId": year,
+    }
+
+
+CALENDAR_MAGIC = b"BEGIN:VCALENDAR"
+
+
+class NotACalendarError(ValueError):
+    """La réponse d'ADE n'est pas un calendrier (page d'erreur HTML, etc.)."""
+
+
+def is_calendar(text):
+    """Indique si le contenu reçu est bien un calendrier iCal."""
+    return bool(text) and text.startswith("BEGIN:VCALENDAR")
+
+
+def _current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Lu une fois au chargement : os.umask ne se lit qu'en le modifiant
+UMASK = _current_umask()
+
+
+def temp_file_for(fname):
+    """
+    Crée un fichier temporaire dans le répertoire de `fname`, pour pouvoir le
+    renommer atomiquement à sa place (`os.replace`).
+
+    `mkstemp` crée le fichier en 0600 ; il reçoit les droits de `fname`
+    s'il existe, sinon ceux d'un fichier ordinaire (0666 moins l'umask),
+    pour que les calendriers publiés restent lisibles par le serveur web.
+
+    Returns:
+        tuple: (descripteur ouvert, chemin du fichier temporaire)
+    """
+    directory, base = os.path.split(fname)
+    fd, tmp = tempfile.mkstemp(dir=directory or ".", prefix=f".{base}.", suffix=".part")
+    try:
+        mode = stat.S_IMODE(os.stat(fname).st_mode)
+    except OSError:
+        mode = 0o666 & ~UMASK
+    os.chmod(tmp, mode)
+    return fd, tmp
+
+
+class ADEClient:
+    """
+    Client HTTP réutilisable vers ADE.
+
+    Args:
+        pool_size (int): Nombre maximal de connexions gardées ouvertes
+        timeout (float): Délai maximal d'une requête, en secondes
+        concurrency (int): Nombre de requêtes simultanées pour `fetch_many`
+        governor (Governor): Régulateur du trafic (le régulateur partagé par défaut)
+        cache (ResponseCache): Cache local des réponses, ou None
+    """
+
+    def __init__(self, pool_size=100, timeout=10, concurrency=200, governor=None, cache=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.cache = cache
+        self._governor = governor
+        self._session = None
+
+    @property
+    def governor(self):
+        """Régulateur du trafic : limite de débit, nouvelles tentatives, disjoncteur."""
+        return self._governor or get_governor()
+
+    @property
+    def session(self):
+        """Session `requests` avec pool de connexions, créée à la demande."""
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def cached(self, params):
+        """
+        Calendrier en cache pour ces paramètres, ou None.
+
+        Raises:
+            OfflineCacheMiss: si le client est hors ligne et la réponse absente du cache
+        """
+        if self.cache is None:
+            return None
+        text = self.cache.get(params)
+        if text is None and self.cache.offline:
+            raise OfflineCacheMiss(f"Absent du cache (hors ligne): resources={params['resources']} "
+                                   f"{params['firstDate']}..{params['lastDate']}")
+        return text
+
+    def remember(self, params, text):
+        """Enregistre un calendrier valide dans le cache, s'il y en a un."""
+        if self.cache is not None and is_calendar(text):
+            self.cache.put(params, text)
+
+    def _get_once(self, params, **kwargs):
+        response = self.session.get(ADE_URL, params=params, **kwargs)
+        if response.status_code in RETRY_STATUSES:
+            response.close()
+            raise TransientError(response.status_code)
+        return response
+
+    def get(self, params, **kwargs):
+        """
+        Requête GET vers ADE à travers le régulateur, retourne l'objet `requests.Response`.
+
+        Raises:
+            ADEUnavailableError: si ADE reste en erreur après les nouvelles tentatives
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.governor.call(self._get_once, params, **kwargs)
+
+    def download_ical(self, params, fname, headers=None, chunk_size=64 * 1024):
+        """
+        Télécharge un calendrier en flux vers un fichier temporaire voisin de `fname`.
+
+        Le début de la réponse est vérifié dès les premiers octets : une page
+        d'erreur est rejetée sans attendre la fin du corps. Le calendrier
+        n'est jamais chargé entier en mémoire ; c'est à l'appelant de renommer
+        le fichier temporaire à la place de `fname` (ou de le supprimer).
+
+        Returns:
+            tuple: (réponse, ou None si le calendrier vient du cache ; chemin du
+                    fichier temporaire, ou None si ADE a répondu 304)
+
+        Raises:
+            NotACalendarError: si la réponse n'est pas un calendrier
+        """
+        text = self.cached(params)
+        if text is not None:
+            fd, tmp = temp_file_for(fname)
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            return None, tmp
+
+        with self.get(params, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                return response, None
+
+            chunks = response.iter_content(chunk_size)
+            head = b""
+            for chunk in chunks:
+                head += chunk
+                if len(head) >= len(CALENDAR_MAGIC):
+                    break
+            if response.status_code != 200 or not head.startswith(CALENDAR_MAGIC):
+                raise NotACalendarError(
+                    f"Réponse {response.status_code} invalide, début: {head[:100].decode('utf-8', 'replace')}"
+                )
+
+            # Le calendrier est compressé pour le cache au fil de l'écriture,
+            # sans relire le fichier ni le charger entier en mémoire
+            pending = self.cache.writer(params) if self.cache is not None else None
+            fd, tmp = temp_file_for(fname)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in itertools.chain([head], chunks):
+                        f.write(chunk)
+                        if pending is not None:
+                            pending.write(chunk)
+            except BaseException:
+                os.remove(tmp)
+                raise
+
+        if pending is not None:
+            pending.commit()
+        return response, tmp
+
+    def probe_events(self, code, windows=None, year=DEFAULT_YEAR, fiche_etalon=FICHE_ETALON, max_events=3):
+        """
+        Vérifie à moindre coût si un code a des événements.
+
+        Chaque fenêtre (par défaut `PROBE_WINDOWS`, quelques semaines de cours
+        chargées) est d'abord cherchée dans le cache, puis lue en flux ligne à
+        ligne ; la lecture s'arrête dès que `max_events` VEVENT ont été vus,
+        sans télécharger le reste. Une fenêtre lue jusqu'au bout est mise en
+        cache comme le serait le calendrier complet.
+
+        Returns:
+            int: Nombre de VEVENT vus (au plus `max_events`), 0 si aucune
+                 fenêtre n'a d'événement
+
+        Raises:
+            NotACalendarError: si ADE ne renvoie pas un calendrier
+            OfflineCacheMiss: si le client est hors ligne et une fenêtre absente du cache
+        """
+        for start, end in windows or PROBE_WINDOWS:
+            params = build_params(code, start, end, year, fiche_etalon)
+            text = self.cached(params)
+            if text is not None:
+                count = min(max_events, text.count("BEGIN:VEVENT"))
+            else:
+                count = self._probe_window(params, max_events)
+            if count:
+                return count
+        return 0
+
+    def _probe_window(self, params, max_events):
+        count = 0
+        lines = []
+        with self.get(params, stream=True) as response:
+            for i, line in enumerate(response.iter_lines()):
+                if i == 0 and (response.status_code != 200 or not line.startswith(CALENDAR_MAGIC)):
+                    raise NotACalendarError(f"Réponse {response.status_code} invalide, "
+                                            f"début: {line[:100].decode('utf-8', 'replace')}")
+                lines.append(line)
+                if line == b"BEGIN:VEVENT":
+                    count += 1
+                    if count >= max_events:
+                        # Réponse incomplète : rien à mettre en cache
+                        return count
+            if not lines:
+                raise NotACalendarError(f"Réponse {response.status_code} vide")
+        self.remember(params, b"\r\n".join(lines).decode("utf-8", "replace") + "\r\n")
+        return count
+
+    def fetch_ical(self, code, start=DEFAULT_START, end=DEFAULT_END, year=DEFAULT_YEAR, fiche_etalon=FICHE_ETALON):
+        """
+        Récupère le calendrier iCal pour un code de formation donné.
+
+        Returns:
+            str: Le calendrier (éventuellement sans événement)
+
+        Raises:
+            NotACalendarError: si ADE ne renvoie pas un calendrier (statut autre
+                               que 200, page de maintenance...) ; ce n'est pas
+                               un code vide
+
+        Les erreurs réseau sont propagées à l'appelant.
+        """
+        params = build_params(code, start, end, year, fiche_etalon)
+        text = self.cached(params)
+        if text is not None:
+            return text
+
+        response = self.get(params)
+        if response.status_code != 200 or not is_calendar(response.text):
+            raise NotACalendarError(f"Réponse {response.status_code} invalide, début: {response.text[:100]}")
+        self.remember(params, response.text)
+        return response.text
+
+    async def _fetch_async(self, http, semaphore, params):
+        text = self.cached(params)
+        if text is not None:
+            return text
+
+        async with semaphore:
+            if http is None:
+                # Sans aiohttp, la session partagée est utilisée depuis des threads
+                response = await asyncio.to_thread(self.get, params)
+                status, text = response.status_code, response.text
+            else:
+                status, text = await self.governor.call_async(self._aiohttp_get, http, params,
+                                                              retry_on=(aiohttp.ClientError,))
+        if status != 200 or not is_calendar(text):
+            return None
+        self.remember(params, text)
+        return text
+
+    @staticmethod
+    async def _aiohttp_get(http, params):
+        async with http.get(ADE_URL, params=params) as response:
+            if response.status in RETRY_STATUSES:
+                raise TransientError(response.status)
+            return response.status, await response.text()
+
+    async def fetch_params_many(self, params_list):
+        """
+        Exécute un lot de requêtes en parallèle sur la boucle courante.
+
+        Returns:
+            list: Un élément par requête, dans le même ordre : le calendrier,
+                  None si la réponse n'est pas un calendrier, ou l'exception levée
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        if aiohttp is None:
+            return await asyncio.gather(
+                *(self._fetch_async(None, semaphore, params) for params in params_list),
+                return_exceptions=True,
+            )
+
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+            # aiohttp refuse les valeurs non textuelles dans les paramètres
+            return await asyncio.gather(
+                *(self._fetch_async(http, semaphore, {k: str(v) for k, v in params.items()})
+                  for params in params_list),
+                return_exceptions=True,
+            )
+
+    async def fetch_many(self, codes, start=DEFAULT_START, end=DEFAULT_END, year=DEFAULT_YEAR,
+                         fiche_etalon=FICHE_ETALON):
+        """
+        Récupère en parallèle les calendriers d'une liste de codes.
+
+        Returns:
+            dict: code -> calendrier, None ou exception (voir `fetch_params_many`)
+        """
+        codes = list(codes)
+        results = await self.fetch_params_many(
+            [build_params(code, start, end, year, fiche_etalon) for code in codes]
+        )
+        return dict(zip(codes, results))
+
+    def fetch_ical_windowed(self, code, start=DEFAULT_START, end=DEFAULT_END, year=DEFAULT_YEAR,
+                            fiche_etalon=FICHE_ETALON, window="month", future_only=False, existing=None):
+        """
+        Récupère un calendrier par fenêtres de dates interrogées en parallèle.
+
+        Une requête sur l'année entière est la plus lente que sert ADE ; on la
+        remplace par une requête par fenêtre (voir `date_windows`), puis les
+        résultats sont fusionnés en un seul VCALENDAR dédoublonné par UID.
+        Une fenêtre en échec est retentée seule une fois.
+
+        Args:
+            window: "month" ou une durée de fenêtre en jours
+            future_only (bool): Ne récupère que les fenêtres à partir d'aujourd'hui ;
+                                les événements passés sont repris de `existing`
+            existing (str): Calendrier déjà connu, utilisé avec `future_only`
+
+        Returns:
+            str: Le calendrier fusionné, ou None si une fenêtre n'a pas pu être
+                 récupérée (réponse qui n'est pas un calendrier, ADE
+                 indisponible ou erreur réseau, absente du cache hors ligne)
+        """
+        windows = date_windows(start, end, window)
+        today = datetime.date.today().isoformat()
+        if future_only:
+            windows = [(first, last) for first, last in windows if last >= today]
+            if not windows:
+                return existing
+
+        params_list = [build_params(code, first, last, year, fiche_etalon) for first, last in windows]
+        results = asyncio.run(self.fetch_params_many(params_list))
+
+        texts = []
+        for (first, last), result in zip(windows, results):
+            if not isinstance(result, str):
+                try:
+                    result = self.fetch_ical(code, first, last, year, fiche_etalon)
+                except (NotACalendarError, ADEUnavailableError, requests.RequestException):
+                    # OfflineCacheMiss est une ADEUnavailableError
+                    return None
+            texts.append(result)
+
+        if future_only and existing:
+            # On garde les événements déjà connus qui précèdent les fenêtres récupérées
+            cutoff = windows[0][0].replace("-", "")
+            header, events, footer = split_calendar(existing)
+            past = [event for event in events if (event_start_date(event) or cutoff) < cutoff]
+            texts.insert(0, join_calendar(header, past, footer))
+
+        return merge_calendars(texts)
+
+    def fetch_batch(self, codes, start=DEFAULT_START, end=DEFAULT_END, year=DEFAULT_YEAR, fiche_etalon=FICHE_ETALON):
+        """
+        Récupère en une seule requête le calendrier combiné de plusieurs codes
+        (le paramètre `resources` d'ADE accepte une liste séparée par des virgules).
+
+        Raises:
+            NotACalendarError: si ADE ne renvoie pas un calendrier
+        """
+        return self.fetch_ical(",".join(str(code) for code in codes), start, end, year, fiche_etalon)
+
+    def fetch_formations_batch(self, tags, start=DEFAULT_START, end=DEFAULT_END, year=DEFAULT_YEAR,
+                               fiche_etalon=FICHE_ETALON, batch_size=20):
+        """
+        Récupère les calendriers de plusieurs formations par lots de `batch_size`
+        codes, puis les sépare par formation (voir `ade_ics.demultiplex`).
+
+        Args:
+            tags (dict): code -> noms de formation cités dans les DESCRIPTION de ce code
+
+        Returns:
+            dict: code -> calendrier, ou None pour les codes dont le lot a échoué
+        """
+        codes = list(tags)
+        calendars = {}
+        for i in range(0, len(codes), batch_size):
+            batch = codes[i:i + batch_size]
+            try:
+                combined = self.fetch_batch(batch, start, end, year, fiche_etalon)
+            except NotACalendarError:
+                calendars.update((code, None) for code in batch)
+                continue
+            per_code = demultiplex(combined, {code: tags[code] for code in batch})
+            calendars.update((code, per_code[code]) for code in batch)
+        return calendars
+
+
+def date_windows(start, end, window="month"):
+    """
+    Découpe l'intervalle [start, end] (dates ISO, bornes incluses) en fenêtres.
+
+    Args:
+        window: "month" pour des fenêtres alignées sur les mois civils,
+                ou un nombre de jours
+
+    Returns:
+        list: Couples (début, fin) au format YYYY-MM-DD
+    """
+    first = datetime.date.fromisoformat(start)
+    last = datetime.date.fromisoformat(end)
+    windows = []
+    while first <= last:
+        if window == "month":
+            next_first = (first.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        else:
+            next_first = first + datetime.timedelta(days=int(window))
+        window_end = min(next_first - datetime.timedelta(days=1), last)
+        windows.append((first.isoformat(), window_end.isoformat()))
+        first = next_first
+    return windows
+
+
+_client = None
+
+
+def get_client():
+    """Retourne le client partagé par tous les scripts du dépôt."""
+    global _client
+    if _client is None:
+        _client = ADEClient()
+    return _client
+
+
+def configure_cache(path=DEFAULT_CACHE, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+    """Active le cache local des réponses sur le client partagé (voir `ade_cache`)."""
+    client = get_client()
+    client.cache = ResponseCache(path, ttl=ttl, max_bytes=max_bytes, offline=offline)
+    return client.cache
+
+
+def fetch_ical(code, start=DEFAULT_START, end=DEFAULT_END, year=DEFAULT_YEAR, fiche_etalon=FICHE_ETALON):
+    """Raccourci vers `ADEClient.fetch_ical` sur le client partagé."""
+    return get_client().fetch_ical(code, start, end, year, fiche_etalon)
+
+
+async def fetch_many(codes, start=DEFAULT_START, end=DEFAULT_END, year=DEFAULT_YEAR, fiche_etalon=FICHE_ETALON):
+    """Raccourci vers `ADEClient.fetch_many` sur le client partagé."""
+    return await get_client().fetch_many(codes, start, end, year, fiche_etalon)
+
+
+def fetch_ical_windowed(code, start=DEFAULT_START, end=DEFAULT_END, year=DEFAULT_YEAR, fiche_etalon=FICHE_ETALON,
+                        window="month", future_only=False, existing=None):
+    """Raccourci vers `ADEClient.fetch_ical_windowed` sur le client partagé."""
+    return get_client().fetch_ical_windowed(code, start, end, year, fiche_etalon, window, future_only, existing)
@@ -0,0 +1,254 @@
+"""
+Régulation de tout le trafic vers ADE.
+
+Un même `Governor` est partagé par le scanner et les rafraîchissements de
+calendriers. Il applique :
+
+- une limite de débit globale (seau à jetons) ;
+- des nouvelles tentatives avec attente exponentielle aléatoire pour les
+  erreurs transitoires (coupure réseau, délai dépassé, 429, 5xx) ;
+- un disjoncteur : après trop d'échecs consécutifs, toutes les requêtes
+  sont mises en pause le temps qu'ADE se rétablisse, au lieu de brûler la
+  plage de codes en erreurs.
+
+Des observateurs (ex. `AdaptiveConcurrency.record`) peuvent suivre chaque
+tentative : ils reçoivent la durée de l'aller-retour HTTP seul, sans les
+attentes du régulateur, et sont prévenus de chaque erreur transitoire sans
+attendre la fin des nouvelles tentatives.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Statuts HTTP qui signalent un problème passager côté ADE
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TransientError(Exception):
+    """Réponse d'ADE qui mérite une nouvelle tentative (429, 5xx)."""
+
+    def __init__(self, status):
+        super().__init__(f"Statut HTTP transitoire {status}")
+        self.status = status
+
+
+class ADEUnavailableError(Exception):
+    """ADE n'a pas répondu correctement malgré les nouvelles tentatives."""
+
+
+TRANSIENT_EXCEPTIONS = (TransientError, requests.ConnectionError, requests.Timeout, asyncio.TimeoutError)
+
+
+class TokenBucket:
+    """
+    Limiteur de débit à seau à jetons, partagé entre threads.
+
+    Args:
+        rate (float): Nombre moyen de requêtes par seconde
+        burst (int): Nombre de requêtes autorisées d'un coup après une pause
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Réserve un jeton et retourne le temps d'attente (en secondes) avant de l'utiliser."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur : s'ouvre après `failure_threshold` échecs consécutifs et
+    suspend les requêtes pendant `reset_timeout` secondes. Une seule requête
+    d'essai passe ensuite ; son succès referme le disjoncteur.
+    """
+
+    def __init__(self, failure_threshold=20, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def wait_time(self):
+        """Temps d'attente avant de pouvoir envoyer une requête (0 si autorisée tout de suite)."""
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if not self.probing:
+                self.probing = True
+                return 0.0
+            return 1.0
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def release(self):
+        """Termine une requête d'essai sans verdict : la suivante pourra réessayer."""
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("ADE semble indisponible (%s échecs consécutifs), pause de %s s",
+                                   self.failures, self.reset_timeout)
+                self.opened_at = time.monotonic()
+
+
+class Governor:
+    """
+    Point de passage unique des requêtes vers ADE.
+
+    Args:
+        rate (float): Débit maximal global, en requêtes par seconde
+        burst (int): Taille du seau à jetons
+        max_retries (int): Nombre de nouvelles tentatives après une erreur transitoire
+        backoff_base (float): Attente de base avant la première nouvelle tentative
+        backoff_max (float): Attente maximale entre deux tentatives
+        breaker (CircuitBreaker): Disjoncteur (un nouveau par défaut)
+    """
+
+    def __init__(self, rate=20.0, burst=None, max_retries=4, backoff_base=0.5, backoff_max=30.0, breaker=None):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.observers = []
+
+    def add_observer(self, observer):
+        """Ajoute `observer(latency, ok)`, appelé après chaque tentative."""
+        self.observers = self.observers + [observer]
+
+    def remove_observer(self, observer):
+        self.observers = [o for o in self.observers if o != observer]
+
+    def _notify(self, started, ok):
+        latency = time.monotonic() - started
+        for observer in self.observers:
+            observer(latency, ok)
+
+    def backoff(self, attempt):
+        """Attente exponentielle avec gigue complète avant la tentative `attempt + 1`."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def call(self, func, *args, **kwargs):
+        """
+        Appelle `func` en respectant la limite de débit et le disjoncteur, en
+        retentant les erreurs transitoires.
+
+        Raises:
+            ADEUnavailableError: si toutes les tentatives ont échoué
+        """
+        for attempt in range(self.max_retries + 1):
+            # Attendre que le disjoncteur se referme, puis un seul jeton par tentative
+            while True:
+                wait = self.breaker.wait_time()
+                if not wait:
+                    break
+                time.sleep(wait)
+            delay = self.bucket.reserve()
+            if delay:
+                time.sleep(delay)
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except TRANSIENT_EXCEPTIONS as e:
+                self.breaker.record_failure()
+                self._notify(started, ok=False)
+                last_error = e
+            except BaseException:
+                # Erreur non transitoire : le disjoncteur ne doit pas rester en demi-ouverture
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                self._notify(started, ok=True)
+                return result
+            if attempt < self.max_retries:
+                time.sleep(self.backoff(attempt))
+        raise ADEUnavailableError(f"Échec après {self.max_retries + 1} tentatives: {last_error}") from last_error
+
+    async def call_async(self, func, *args, retry_on=(), **kwargs):
+        """
+        Équivalent de `call` pour une coroutine : les attentes ne bloquent pas
+        la boucle d'événements. `retry_on` ajoute des exceptions transitoires
+        propres au client asynchrone (ex. `aiohttp.ClientError`).
+        """
+        transient = TRANSIENT_EXCEPTIONS + tuple(retry_on)
+        for attempt in range(self.max_retries + 1):
+            # Attendre que le disjoncteur se referme, puis un seul jeton par tentative
+            while True:
+                wait = self.breaker.wait_time()
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+            delay = self.bucket.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            started = time.monotonic()
+            try:
+                result = await func(*args, **kwargs)
+            except transient as e:
+                self.breaker.record_failure()
+                self._notify(started, ok=False)
+                last_error = e
+            except BaseException:
+                # Erreur non transitoire : le disjoncteur ne doit pas rester en demi-ouverture
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                self._notify(started, ok=True)
+                return result
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.backoff(attempt))
+        raise ADEUnavailableError(f"Échec après {self.max_retries + 1} tentatives: {last_error}") from last_error
+
+
+_governor = None
+
+
+def get_governor():
+    """Retourne le régulateur partagé par tous les accès à ADE."""
+    global _governor
+    if _governor is None:
+        _governor = Governor()
+    return _governor
+
+
+def configure(**kwargs):
+    """Remplace le régulateur partagé (voir `Governor` pour les paramètres)."""
+    global _governor
+    _governor = Governor(**kwargs)
+    return _governor
@@ -0,0 +1,268 @@
+"""
+Outils de manipulation textuelle des exports iCal d'ADE.
+
+Les exports ADE sont un sous-ensemble très régulier de la RFC 5545 : on peut
+les traiter ligne à ligne sans passer par le modèle objet d'icalendar.
+"""
+import hashlib
+import re
+
+# Propriétés réécrites par ADE à chaque export, même si le cours n'a pas changé
+VOLATILE_PROPERTIES = ("DTSTAMP", "LAST-MODIFIED", "SEQUENCE")
+
+# Mention ajoutée par ADE à la fin de chaque DESCRIPTION
+EXPORT_STAMP = re.compile(r"\(Export[ée] le:[^)]*\)")
+
+
+def iter_unfolded(raw_lines):
+    """
+    Recolle à la volée les lignes repliées (qui commencent par un espace ou
+    une tabulation) d'un itérable de lignes physiques, par exemple un fichier
+    ouvert, et produit les lignes logiques non vides.
+    """
+    pending = None
+    for line in raw_lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and pending is not None:
+            pending += line[1:]
+            continue
+        if pending:
+            yield pending
+        pending = line
+    if pending:
+        yield pending
+
+
+def unfold_lines(text):
+    """
+    Découpe un calendrier en lignes logiques (les lignes repliées, qui
+    commencent par un espace ou une tabulation, sont recollées).
+    """
+    return list(iter_unfolded(text.splitlines()))
+
+
+def property_name(line):
+    """Nom de la propriété d'une ligne logique (`DTSTART;TZID=...:` -> `DTSTART`)."""
+    return re.split(r"[;:]", line, maxsplit=1)[0].upper()
+
+
+def split_calendar(text):
+    """
+    Sépare un calendrier en en-tête, événements et pied.
+
+    Returns:
+        tuple: (lignes d'en-tête, liste des événements sous forme de listes de
+               lignes de `BEGIN:VEVENT` à `END:VEVENT`, lignes de fin)
+    """
+    header, events, footer = [], [], []
+    current = None
+    for line in unfold_lines(text):
+        if line == "BEGIN:VEVENT":
+            current = [line]
+        elif current is not None:
+            current.append(line)
+            if line == "END:VEVENT":
+                events.append(current)
+                current = None
+        elif events or line == "END:VCALENDAR":
+            footer.append(line)
+        else:
+            header.append(line)
+    return header, events, footer
+
+
+def normalize_event(lines):
+    """Retire d'un événement tout ce qui change à chaque export."""
+    normalized = []
+    for line in lines:
+        if property_name(line) in VOLATILE_PROPERTIES:
+            continue
+        normalized.append(EXPORT_STAMP.sub("", line))
+    return "\n".join(normalized)
+
+
+def normalize_calendar(text):
+    """
+    Forme normalisée d'un calendrier : sans les propriétés volatiles
+    (`DTSTAMP`, `(Exporté le: ...)`...) et avec les événements triés, pour
+    que deux exports du même emploi du temps soient identiques.
+    """
+    header, events, footer = split_calendar(text)
+    blocks = sorted(normalize_event(event) for event in events)
+    return "\n".join(header + blocks + footer)
+
+
+def hash_calendar_lines(raw_lines):
+    """
+    Empreinte SHA-256 du calendrier normalisé, calculée en un seul passage
+    sur un itérable de lignes physiques sans garder le calendrier en mémoire.
+
+    Chaque événement normalisé est réduit à sa propre empreinte ; les
+    empreintes sont triées pour que l'ordre des événements n'importe pas.
+    """
+    outer = hashlib.sha256()
+    event_digests = []
+    current = None
+    for line in iter_unfolded(raw_lines):
+        if line == "BEGIN:VEVENT":
+            current = [line]
+        elif current is not None:
+            current.append(line)
+            if line == "END:VEVENT":
+                event_digests.append(hashlib.sha256(normalize_event(current).encode("utf-8")).digest())
+                current = None
+        else:
+            outer.update(line.encode("utf-8") + b"\n")
+    for digest in sorted(event_digests):
+        outer.update(digest)
+    return outer.hexdigest()
+
+
+def content_hash(text):
+    """Empreinte SHA-256 du calendrier normalisé (voir `hash_calendar_lines`)."""
+    return hash_calendar_lines(text.splitlines())
+
+
+def file_content_hash(path):
+    """Empreinte SHA-256 normalisée d'un fichier ics, lu ligne à ligne."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return hash_calendar_lines(f)
+
+
+def event_property(lines, name):
+    """Valeur (brute) de la propriété `name` d'un événement, ou None."""
+    for line in lines:
+        if property_name(line) == name:
+            return line.split(":", 1)[1] if ":" in line else ""
+    return None
+
+
+def event_start_date(lines):
+    """Date de début d'un événement au format `YYYYMMDD`, ou None."""
+    value = event_property(lines, "DTSTART")
+    return value[:8] if value else None
+
+
+def calendar_stats(text):
+    """
+    Nombre d'événements et dates de début (`YYYYMMDD`) du premier et du
+    dernier événement, en un seul passage sur le calendrier.
+
+    Returns:
+        dict: {"events": nombre, "first_date": date ou None, "last_date": date ou None}
+    """
+    count = 0
+    first = last = None
+    for line in iter_unfolded(text.splitlines()):
+        if line == "BEGIN:VEVENT":
+            count += 1
+        elif line.startswith("DTSTART") and property_name(line) == "DTSTART":
+            date = line.split(":", 1)[1][:8] if ":" in line else None
+            if date:
+                first = date if first is None else min(first, date)
+                last = date if last is None else max(last, date)
+    return {"events": count, "first_date": first, "last_date": last}
+
+
+def fold_line(line, limit=75):
+    """
+    Replie une ligne logique trop longue (RFC 5545, section 3.1) : chaque
+    ligne physique fait au plus `limit` octets UTF-8, espace de continuation
+    comprise, sans couper un caractère multioctet.
+    """
+    if len(line.encode("utf-8")) <= limit:
+        return line
+    parts = []
+    current, size = [], 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        if size + width > limit:
+            parts.append("".join(current))
+            # Les lignes suivantes commencent par l'espace de continuation
+            current, size = [" "], 1
+        current.append(char)
+        size += width
+    parts.append("".join(current))
+    return "\r\n".join(parts)
+
+
+def join_calendar(header, events, footer):
+    """Reconstruit le texte d'un calendrier à partir de `split_calendar`, avec des fins de ligne CRLF."""
+    lines = list(header)
+    for event in events:
+        lines.extend(event)
+    lines.extend(footer)
+    return "\r\n".join(fold_line(line) for line in lines) + "\r\n"
+
+
+def merge_calendars(texts):
+    """
+    Fusionne plusieurs calendriers en un seul VCALENDAR.
+
+    Les événements sont dédoublonnés par UID ; en cas de doublon, c'est la
+    version du calendrier le plus tardif dans `texts` qui est conservée.
+    L'en-tête et le pied sont repris du premier calendrier.
+    """
+    header, footer = None, None
+    events = {}
+    for text in texts:
+        text_header, text_events, text_footer = split_calendar(text)
+        if header is None:
+            header, footer = text_header, text_footer
+        for event in text_events:
+            uid = event_property(event, "UID") or "\n".join(event)
+            events[uid] = event
+    if header is None:
+        header, footer = ["BEGIN:VCALENDAR"], ["END:VCALENDAR"]
+    return join_calendar(header, events.values(), footer)
+
+
+# Lignes de DESCRIPTION qui désignent une formation ("M2 DATA", "M1-INFO", ...)
+FORMATION_PATTERN = re.compile(r'^(M[1-2]|L[1-3])\s+[A-Z0-9/\-]+$')
+ALT_FORMATION_PATTERN = re.compile(r'^(M[1-2]|L[1-3])\-[A-Z0-9/\-]+$')
+
+
+def description_lines(description):
+    """Lignes non vides d'une DESCRIPTION ADE (les `\\n` échappés sont des sauts de ligne)."""
+    return [line.strip() for line in description.replace('\\n', '\n').split('\n') if line.strip()]
+
+
+def description_formations(description):
+    """Ensemble des noms de formation cités dans une DESCRIPTION."""
+    return {line for line in description_lines(description)
+            if FORMATION_PATTERN.match(line) or ALT_FORMATION_PATTERN.match(line)}
+
+
+def normalize_formation_name(name):
+    """Forme canonique d'un nom de formation (`M2  MPRI` -> `M2 MPRI`)."""
+    return " ".join(name.split()).upper()
+
+
+def demultiplex(text, tags):
+    """
+    Répartit les événements d'un calendrier multi-ressources par formation.
+
+    Un événement est attribué à un code dès qu'une ligne de sa DESCRIPTION
+    correspond à l'un des noms de formation de ce code ; un cours mutualisé
+    peut donc apparaître dans plusieurs calendriers.
+
+    Args:
+        text (str): Calendrier renvoyé pour plusieurs ressources
+        tags (dict): code -> noms de formation de ce code (ex. ["M2 MPRI"])
+
+    Returns:
+        dict: code -> calendrier ; les événements qui ne correspondent à
+              aucun code sont regroupés sous la clé None
+    """
+    header, events, footer = split_calendar(text)
+    wanted = {code: {normalize_formation_name(name) for name in names} for code, names in tags.items()}
+    per_code = {code: [] for code in tags}
+    per_code[None] = []
+
+    for event in events:
+        lines = {normalize_formation_name(line) for line in description_lines(event_property(event, "DESCRIPTION") or "")}
+        matched = [code for code, names in wanted.items() if names & lines]
+        for code in matched or [None]:
+            per_code[code].append(event)
+
+    return {code: join_calendar(header, code_events, footer) for code, code_events in per_code.items()}
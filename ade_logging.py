@@ -0,0 +1,197 @@
+"""
+Journalisation commune des scripts ADE.
+
+Les messages passent par une file (`QueueHandler`) : le thread qui écrit un
+message ne fait que le déposer, l'écriture sur la console ou dans un fichier
+est faite par un thread dédié (`QueueListener`). Les messages de routine
+propres à un code (champ `code`, niveau DEBUG) sont échantillonnés, et les
+traitements longs affichent une seule ligne de progression périodique (voir
+`ProgressReporter`).
+
+    from ade_logging import setup_logging
+    setup_logging("INFO", log_file="scan.log")
+    logger = logging.getLogger(__name__)
+    logger.debug("Traitement du code %s", code, extra={"code": code})
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from collections import Counter
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+DATE_FORMAT = "%H:%M:%S"
+
+# Attributs standard d'un LogRecord, pour isoler les champs passés par `extra`
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Une ligne JSON par message, avec les champs passés par `extra`."""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update({key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRIBUTES})
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class CodeSampler(logging.Filter):
+    """
+    Ne garde qu'un message sur `every` parmi les messages propres à un code
+    (champ `code`) de niveau inférieur à INFO. Les autres messages passent
+    tous.
+    """
+
+    def __init__(self, every=100):
+        super().__init__()
+        self.every = max(1, every)
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno >= logging.INFO or getattr(record, "code", None) is None:
+            return True
+        return next(self._counter) % self.every == 0
+
+
+_listener = None
+
+
+def setup_logging(level="INFO", log_file=None, json_lines=False, sample_every=100, stream=None):
+    """
+    Configure la journalisation du processus.
+
+    Args:
+        level (str|int): Niveau minimal des messages
+        log_file (str): Fichier où copier les messages (en plus de la console)
+        json_lines (bool): Une ligne JSON par message au lieu du texte
+        sample_every (int): Ne garde qu'un message DEBUG par code sur `sample_every`
+        stream: Flux de la console (sortie d'erreur par défaut)
+    """
+    global _listener
+    stop_logging()
+
+    formatter = JSONFormatter() if json_lines else logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+    handlers = [logging.StreamHandler(stream or sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(CodeSampler(sample_every))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+
+
+def stop_logging():
+    """Écrit les messages encore dans la file et arrête le thread d'écriture."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def add_logging_arguments(parser):
+    """Ajoute les options de journalisation communes à un `argparse.ArgumentParser`."""
+    parser.add_argument("--log-level", default="INFO", help="Niveau des messages (DEBUG, INFO, WARNING...)")
+    parser.add_argument("--log-file", help="Copie les messages dans ce fichier")
+    parser.add_argument("--log-json", action="store_true", help="Messages au format JSON, un par ligne")
+    parser.add_argument("--log-sample", type=int, default=100,
+                        help="Ne garde qu'un message DEBUG par code sur N")
+
+
+def setup_logging_from_args(args):
+    """Configure la journalisation à partir des options de `add_logging_arguments`."""
+    setup_logging(args.log_level, args.log_file, args.log_json, args.log_sample)
+
+
+def format_duration(seconds):
+    """Durée lisible (`1:02:03`), ou `?` si elle est inconnue."""
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class ProgressReporter:
+    """
+    Ligne de progression périodique d'un traitement de `total` éléments :
+    avancement, débit, temps restant estimé, formations trouvées et
+    répartition des erreurs par type.
+
+    Args:
+        total (int): Nombre d'éléments à traiter
+        interval (float): Intervalle entre deux lignes, en secondes
+        details: Fonctions sans argument dont le texte est ajouté à la ligne
+        logger (logging.Logger): Journal où écrire la ligne
+    """
+
+    def __init__(self, total, interval=10.0, details=(), logger=None):
+        self.total = total
+        self.interval = interval
+        self.details = list(details)
+        self.logger = logger or logging.getLogger("ade.progress")
+        self.completed = 0
+        self.skipped = 0
+        self.hits = 0
+        self.errors = Counter()
+        self.started = time.monotonic()
+        self._last_report = self.started
+
+    @property
+    def done(self):
+        return self.completed + self.skipped
+
+    def record(self, hit=False, error=None):
+        """
+        Compte un élément traité.
+
+        Args:
+            hit (bool): L'élément est une formation trouvée
+            error (str): Type de l'erreur, pour un élément en erreur
+        """
+        self.completed += 1
+        if hit:
+            self.hits += 1
+        if error:
+            self.errors[error] += 1
+        self.maybe_report()
+
+    def maybe_report(self, force=False):
+        """Écrit la ligne de progression si `interval` est écoulé (ou si `force`)."""
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate and self.total else None
+        parts = [
+            f"Progression: {self.done}/{self.total} ({self.done / max(self.total, 1) * 100:.1f}%)",
+            f"{rate:.1f} codes/s",
+            f"reste {format_duration(eta)}",
+            f"{self.hits} formations",
+            "erreurs: " + (", ".join(f"{kind}={count}" for kind, count in self.errors.most_common()) or "0"),
+        ]
+        parts.extend(detail() for detail in self.details)
+        self.logger.info(" - ".join(parts))
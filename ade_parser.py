@@ -0,0 +1,249 @@
+"""
+Lecture rapide des événements d'un export iCal d'ADE.
+
+Les exports ADE n'utilisent qu'une petite partie de la RFC 5545 (DTSTART et
+DTEND avec TZID ou en UTC, SUMMARY, LOCATION, DESCRIPTION, UID) : ils se
+lisent ligne à ligne, sans construire le modèle objet d'icalendar. Chaque
+VEVENT donne un `Event` léger. Un événement qui sort de ce sous-ensemble
+(paramètre entre guillemets, propriété en double, date dans un format
+inattendu, fuseau inconnu...) est confié à icalendar.
+
+    python ade_parser.py masters/*.ics
+
+compare ce parseur à icalendar sur chaque fichier (voir `compare_with_icalendar`).
+"""
+import argparse
+import datetime
+import re
+import sys
+import time
+from collections import namedtuple
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import icalendar
+
+from ade_ics import iter_unfolded
+
+# Événement réduit à ce qu'utilisent les pages et les scripts ; les propriétés
+# absentes valent None, `start` et `end` sont des date ou datetime comme dans icalendar
+Event = namedtuple("Event", "uid summary description location start end recurrent")
+
+# Propriétés lues par le parseur, avec le champ de `Event` correspondant
+TEXT_PROPERTIES = {"UID": "uid", "SUMMARY": "summary", "DESCRIPTION": "description", "LOCATION": "location"}
+DATE_PROPERTIES = {"DTSTART": "start", "DTEND": "end"}
+PROPERTIES = {**TEXT_PROPERTIES, **DATE_PROPERTIES}
+
+ESCAPE = re.compile(r"\\([\\;,nN])")
+UNESCAPED = {"\\": "\\", ";": ";", ",": ",", "n": "\n", "N": "\n"}
+
+
+class UnsupportedEvent(ValueError):
+    """Événement hors du sous-ensemble de la RFC 5545 lu par `parse_event`."""
+
+
+def unescape_text(value):
+    """Décode une valeur TEXT (`\\n`, `\\,`, `\\;`, `\\\\`)."""
+    if "\\" not in value:
+        return value
+    return ESCAPE.sub(lambda match: UNESCAPED[match.group(1)], value)
+
+
+@lru_cache(maxsize=None)
+def zone(tzid):
+    try:
+        return ZoneInfo(tzid)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise UnsupportedEvent(f"Fuseau inconnu: {tzid}")
+
+
+def parse_date_value(value, params):
+    """
+    Valeur d'un DTSTART ou DTEND : date (`VALUE=DATE`), datetime UTC (`Z`),
+    datetime dans le fuseau `TZID`, ou datetime flottant.
+    """
+    return _parse_date(value, params.get("VALUE"), params.get("TZID"))
+
+
+# Les mêmes horaires reviennent d'une semaine et d'un fichier à l'autre ; les
+# date et datetime étant immuables, une valeur déjà lue est partagée
+@lru_cache(maxsize=8192)
+def _parse_date(value, value_type, tzid):
+    try:
+        if value_type == "DATE" or len(value) == 8:
+            return datetime.date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+        if len(value) in (15, 16) and value[8] == "T":
+            dt = datetime.datetime(int(value[:4]), int(value[4:6]), int(value[6:8]),
+                                   int(value[9:11]), int(value[11:13]), int(value[13:15]))
+            if value.endswith("Z"):
+                return dt.replace(tzinfo=zone("UTC"))
+            if tzid is not None:
+                return dt.replace(tzinfo=zone(tzid))
+            if len(value) == 15:
+                return dt
+    except ValueError:
+        pass
+    raise UnsupportedEvent(f"Date non reconnue: {value}")
+
+
+def parse_event(lines):
+    """
+    Lit un VEVENT (lignes logiques, de `BEGIN:VEVENT` à `END:VEVENT`).
+
+    Raises:
+        UnsupportedEvent: si l'événement sort du sous-ensemble lu ici
+    """
+    fields = {}
+    recurrent = False
+    depth = 0
+    for line in lines[1:-1]:
+        head, sep, value = line.partition(":")
+        name = head.split(";", 1)[0].upper() if ";" in head else head.upper()
+        # Les sous-composants (VALARM...) ne font pas partie des propriétés de l'événement
+        if name == "BEGIN":
+            depth += 1
+            continue
+        if name == "END":
+            depth -= 1
+            continue
+        field = PROPERTIES.get(name)
+        if depth or field is None:
+            recurrent = recurrent or (name == "RRULE" and not depth)
+            continue
+        if not sep or '"' in head:
+            raise UnsupportedEvent(f"Ligne non reconnue: {line}")
+        if field in fields:
+            raise UnsupportedEvent(f"Propriété en double: {name}")
+        if name in DATE_PROPERTIES:
+            params = dict(param.split("=", 1) for param in head.split(";")[1:] if "=" in param) if ";" in head else {}
+            fields[field] = parse_date_value(value, params)
+        else:
+            fields[field] = unescape_text(value)
+
+    return Event(fields.get("uid"), fields.get("summary"), fields.get("description"), fields.get("location"),
+                 fields.get("start"), fields.get("end"), recurrent)
+
+
+def event_component(lines):
+    """Objet `icalendar.Event` d'un VEVENT donné par ses lignes logiques."""
+    return icalendar.Event.from_ical("\r\n".join(lines))
+
+
+def event_from_component(component):
+    """`Event` tiré d'un composant VEVENT d'icalendar."""
+    def text(name):
+        value = component.get(name)
+        return None if value is None else str(value)
+
+    start, end = component.get("dtstart"), component.get("dtend")
+    return Event(text("uid"), text("summary"), text("description"), text("location"),
+                 start.dt if start is not None else None, end.dt if end is not None else None,
+                 component.get("rrule") is not None)
+
+
+def iter_vevent_lines(raw_lines):
+    """Lignes logiques de chaque VEVENT d'un itérable de lignes physiques (ex. un fichier ouvert)."""
+    current = None
+    depth = 0
+    for line in iter_unfolded(raw_lines):
+        if current is None:
+            if line == "BEGIN:VEVENT":
+                current = [line]
+            continue
+        current.append(line)
+        if line.startswith(("BEGIN:", "END:")):
+            if line[0] == "B":
+                depth += 1
+            elif depth:
+                depth -= 1
+            elif line == "END:VEVENT":
+                yield current
+                current = None
+
+
+def read_event(lines):
+    """`Event` d'un VEVENT, lu par `parse_event` ou, à défaut, par icalendar."""
+    try:
+        return parse_event(lines)
+    except UnsupportedEvent:
+        return event_from_component(event_component(lines))
+
+
+def iter_events(raw_lines):
+    """`Event` de chaque VEVENT d'un itérable de lignes physiques, à la demande."""
+    for lines in iter_vevent_lines(raw_lines):
+        yield read_event(lines)
+
+
+def open_calendar(path):
+    """Ouvre un fichier ics en texte, pour `iter_vevent_lines` ou `iter_events`."""
+    return open(path, "r", encoding="utf-8", errors="replace", newline="")
+
+
+def iter_file_events(path):
+    """`Event` de chaque VEVENT d'un fichier ics, lu en flux."""
+    with open_calendar(path) as f:
+        yield from iter_events(f)
+
+
+def read_events(path):
+    """Liste des `Event` d'un fichier ics."""
+    return list(iter_file_events(path))
+
+
+def same_value(fast, reference):
+    """Égalité stricte : même type, même instant et même décalage horaire pour les dates."""
+    if type(fast) is not type(reference):
+        return False
+    if isinstance(fast, datetime.datetime):
+        return fast == reference and fast.utcoffset() == reference.utcoffset()
+    return fast == reference
+
+
+def compare_with_icalendar(path):
+    """
+    Compare `read_events` à la lecture du même fichier par icalendar.
+
+    Returns:
+        dict: nombre d'événements, durées des deux lectures (en secondes) et
+              différences (liste de (uid, champ, valeur lue ici, valeur d'icalendar))
+    """
+    started = time.perf_counter()
+    fast = read_events(path)
+    fast_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        calendar = icalendar.Calendar.from_ical(f.read())
+    reference = [event_from_component(component) for component in calendar.walk("VEVENT")]
+    reference_time = time.perf_counter() - started
+
+    differences = []
+    if len(fast) != len(reference):
+        differences.append((None, "count", len(fast), len(reference)))
+    for fast_event, reference_event in zip(fast, reference):
+        for field in Event._fields:
+            a, b = getattr(fast_event, field), getattr(reference_event, field)
+            if not same_value(a, b):
+                differences.append((reference_event.uid, field, a, b))
+    return {"events": len(fast), "time": fast_time, "icalendar_time": reference_time, "differences": differences}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare le parseur rapide à icalendar sur des fichiers ics.")
+    parser.add_argument("files", nargs="+", help="Fichiers ics à comparer")
+    args = parser.parse_args()
+
+    failed = False
+    for path in args.files:
+        result = compare_with_icalendar(path)
+        print(f"{path}: {result['events']} événements, {result['time'] * 1000:.1f} ms "
+              f"(icalendar: {result['icalendar_time'] * 1000:.1f} ms), {len(result['differences'])} différences")
+        for uid, field, fast, reference in result["differences"][:20]:
+            print(f"  {uid} {field}: {fast!r} != {reference!r}")
+        failed = failed or bool(result["differences"])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,470 @@
+"""
+Récupération et rafraîchissement des calendriers de formation ADE.
+
+En mode rafraîchissement, chaque fichier `{formation}-{code}.ics` est
+accompagné d'un fichier d'état `{formation}-{code}.ics.meta.json` qui garde les
+validateurs HTTP (ETag, Last-Modified) et l'empreinte du contenu normalisé.
+Si ADE répond 304, ou si l'empreinte n'a pas changé, le fichier n'est pas
+réécrit et la formation est déclarée inchangée.
+
+Le script se lance sur le manifeste des formations sources (voir
+`refresh_manifest`) :
+
+    python ade_refresh.py [--manifest ade_sources.json] [--workers 4] [--force] [--cache ade_cache.sqlite] [--offline]
+
+Les calendriers sont téléchargés en flux dans un fichier temporaire, puis
+renommés atomiquement à leur place : un lecteur ne voit jamais de `.ics` à
+moitié écrit.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ade_client import (get_client, build_params, temp_file_for, configure_cache, NotACalendarError,
+                        DEFAULT_CACHE, DEFAULT_START, DEFAULT_END, DEFAULT_YEAR, FICHE_ETALON)
+from ade_ics import file_content_hash
+from event_store import EventStore
+from ade_logging import add_logging_arguments, setup_logging_from_args
+
+# Statuts rapportés pour chaque formation
+UNCHANGED = "unchanged"
+UPDATED = "updated"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+DEFAULT_MANIFEST = "ade_sources.json"
+
+logger = logging.getLogger(__name__)
+
+
+def calendar_path(formation_name, code, out_dir="."):
+    """Chemin du fichier ics d'une formation."""
+    return f"{out_dir}/{formation_name}-{code}.ics"
+
+
+def load_state(fname):
+    """Charge l'état du dernier rafraîchissement d'un fichier ics."""
+    try:
+        with open(f"{fname}.meta.json", 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(fname, state):
+    """Sauvegarde l'état du dernier rafraîchissement d'un fichier ics."""
+    with open(f"{fname}.meta.json", 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+
+
+def refresh_formation_calendar(formation_name=None, code=None, start=DEFAULT_START, end=DEFAULT_END,
+                               year=DEFAULT_YEAR, fiche_etalon=FICHE_ETALON, out_dir=".", window=None,
+                               future_only=False, fname=None):
+    """
+    Rafraîchit le calendrier d'une formation sans réécrire un fichier inchangé.
+
+    Les en-têtes conditionnels sont envoyés si ADE a fourni des validateurs au
+    rafraîchissement précédent ; sinon on compare l'empreinte du contenu
+    normalisé (voir `ade_ics.normalize_calendar`).
+
+    Avec `window` (voir `ade_client.date_windows`), le calendrier est récupéré
+    par fenêtres de dates ; `future_only` ne récupère que les fenêtres à
+    partir d'aujourd'hui et garde les événements passés du fichier existant.
+    `fname` remplace le chemin par défaut `{out_dir}/{formation}-{code}.ics`.
+
+    Returns:
+        tuple: (statut parmi UNCHANGED, UPDATED, FAILED ; chemin du fichier ics ou None)
+    """
+    if not code:
+        logger.error("Aucun code de formation fourni")
+        return FAILED, None
+
+    if not formation_name:
+        formation_name = f"Formation-{code}"
+
+    if fname is None:
+        fname = calendar_path(formation_name, code, out_dir)
+    os.makedirs(os.path.dirname(fname) or ".", exist_ok=True)
+
+    # L'état n'a de sens que si le fichier correspondant existe toujours
+    state = load_state(fname) if os.path.exists(fname) else {}
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+
+    logger.info("Rafraîchissement du calendrier pour %s (code: %s)...", formation_name, code)
+
+    try:
+        if window:
+            # Récupération par fenêtres : pas de validateurs HTTP, seule l'empreinte compte
+            existing = None
+            if future_only and os.path.exists(fname):
+                with open(fname, "r") as f:
+                    existing = f.read()
+            calendar = get_client().fetch_ical_windowed(code, start, end, year, fiche_etalon,
+                                                        window, future_only, existing)
+            if calendar is None:
+                logger.error("Une fenêtre du calendrier de %s n'a pas pu être récupérée", formation_name)
+                return FAILED, None
+            return store_calendar(fname, calendar, state), fname
+
+        response, tmp = get_client().download_ical(build_params(code, start, end, year, fiche_etalon),
+                                                   fname, headers=headers)
+    except NotACalendarError as e:
+        logger.error("La réponse ne contient pas de calendrier valide pour %s: %s", formation_name, e)
+        return FAILED, None
+    except Exception as e:
+        logger.error("Erreur lors de la récupération du calendrier de %s: %s", formation_name, e)
+        return FAILED, None
+
+    if tmp is None:
+        state["fetched_at"] = time.time()
+        save_state(fname, state)
+        logger.info("Calendrier inchangé (304) : %s", fname)
+        return UNCHANGED, fname
+
+    validators = {}
+    if response is not None:
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+    return commit_calendar_file(fname, tmp, state, validators), fname
+
+
+def write_temp_calendar(fname, calendar):
+    """Écrit un calendrier dans un fichier temporaire voisin de `fname` et retourne son chemin."""
+    fd, tmp = temp_file_for(fname)
+    with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+        f.write(calendar)
+    return tmp
+
+
+def commit_calendar_file(fname, tmp, state, validators=None):
+    """
+    Remplace atomiquement `fname` par le fichier temporaire `tmp` si son
+    empreinte normalisée a changé depuis `state` (sinon `tmp` est supprimé),
+    puis met à jour le fichier d'état.
+
+    Returns:
+        str: UNCHANGED ou UPDATED
+    """
+    digest = file_content_hash(tmp)
+    status = UNCHANGED if digest == state.get("hash") else UPDATED
+
+    if status == UPDATED:
+        os.replace(tmp, fname)
+        logger.info("Calendrier enregistré dans %s", fname)
+    else:
+        os.remove(tmp)
+        logger.info("Calendrier inchangé : %s", fname)
+
+    save_state(fname, dict(validators or {}, hash=digest, fetched_at=time.time()))
+    return status
+
+
+def store_calendar(fname, calendar, state, validators=None):
+    """Comme `commit_calendar_file`, pour un calendrier déjà en mémoire."""
+    return commit_calendar_file(fname, write_temp_calendar(fname, calendar), state, validators)
+
+
+def get_formation_calendar(formation_name=None, code=None, start=DEFAULT_START, end=DEFAULT_END,
+                           year=DEFAULT_YEAR, fiche_etalon=FICHE_ETALON, out_dir=".", refresh=False,
+                           window=None, future_only=False):
+    """
+    Récupère le calendrier d'une formation par son code.
+
+    Arguments:
+        formation_name (str): Nom de la formation (facultatif, pour le nom du fichier)
+        code (str): Code de la formation à récupérer
+        start (str): Date de début au format YYYY-MM-DD
+        end (str): Date de fin au format YYYY-MM-DD
+        year (int): Année académique (projectId)
+        fiche_etalon (str): Fiche étalon
+        out_dir (str): Répertoire de sortie pour le fichier ics
+        refresh (bool): Ne réécrit le fichier que si le calendrier a changé
+                        (voir `refresh_formation_calendar`)
+        window: Découpage de la période en fenêtres récupérées en parallèle
+                ("month" ou un nombre de jours), None pour une seule requête
+        future_only (bool): Avec `window`, ne récupère que les fenêtres à venir
+
+    Returns:
+        str: Chemin du fichier calendrier créé, ou None en cas d'erreur
+    """
+    if refresh:
+        return refresh_formation_calendar(formation_name, code, start, end, year, fiche_etalon, out_dir,
+                                          window, future_only)[1]
+
+    # Si aucun code n'est fourni, on ne peut pas continuer
+    if not code:
+        logger.error("Aucun code de formation fourni")
+        return None
+
+    # Si aucun nom n'est fourni, on utilise le code comme nom
+    if not formation_name:
+        formation_name = f"Formation-{code}"
+
+    # Création du répertoire de sortie si nécessaire
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Nom du fichier de sortie
+    fname = calendar_path(formation_name, code, out_dir)
+
+    logger.info("Récupération du calendrier pour %s (code: %s)...", formation_name, code)
+
+    try:
+        # Récupération du calendrier, écrit d'abord dans un fichier temporaire
+        if window:
+            calendar = get_client().fetch_ical_windowed(code, start, end, year, fiche_etalon, window)
+            if calendar is None:
+                logger.error("Une fenêtre du calendrier de %s n'a pas pu être récupérée", formation_name)
+                return None
+            tmp = write_temp_calendar(fname, calendar)
+        else:
+            _, tmp = get_client().download_ical(build_params(code, start, end, year, fiche_etalon), fname)
+
+        # Remplacement atomique : un lecteur ne voit jamais de fichier à moitié écrit
+        os.replace(tmp, fname)
+
+        logger.info("Calendrier enregistré dans %s", fname)
+        return fname
+
+    except NotACalendarError as e:
+        logger.error("La réponse ne contient pas de calendrier valide pour %s: %s", formation_name, e)
+        return None
+
+    except Exception as e:
+        logger.error("Erreur lors de la récupération du calendrier de %s: %s", formation_name, e)
+        return None
+
+
+def refresh_formations(formations, **kwargs):
+    """
+    Rafraîchit une liste de formations et rapporte le statut de chacune.
+
+    Args:
+        formations (list): Couples (nom de la formation, code)
+        **kwargs: Paramètres transmis à `refresh_formation_calendar`
+
+    Returns:
+        dict: nom de la formation -> UNCHANGED, UPDATED ou FAILED
+    """
+    report = {}
+    for formation_name, code in formations:
+        report[formation_name] = refresh_formation_calendar(formation_name, code, **kwargs)[0]
+    return report
+
+
+def print_report(report):
+    """Affiche le bilan d'un rafraîchissement."""
+    for formation_name, status in report.items():
+        print(f"{formation_name}: {status}")
+    if not any(status == UPDATED for status in report.values()):
+        print("Aucun calendrier modifié, inutile de reconstruire les calendriers LOGOS.")
+
+
+def refresh_formations_batch(formations, start=DEFAULT_START, end=DEFAULT_END, year=DEFAULT_YEAR,
+                             fiche_etalon=FICHE_ETALON, out_dir=".", batch_size=20):
+    """
+    Rafraîchit plusieurs formations en regroupant leurs codes dans une même
+    requête ADE, puis en séparant les événements par formation d'après les
+    noms cités dans les DESCRIPTION (voir `ade_ics.demultiplex`).
+
+    Args:
+        formations (list): Triplets (nom de la formation, code, noms de formation
+                           cités dans les DESCRIPTION, ex. ["M2 MPRI"])
+
+    Returns:
+        dict: nom de la formation -> UNCHANGED, UPDATED ou FAILED
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tags = {code: names for _, code, names in formations}
+
+    try:
+        calendars = get_client().fetch_formations_batch(tags, start, end, year, fiche_etalon, batch_size)
+    except Exception as e:
+        logger.error("Erreur lors de la récupération groupée des calendriers: %s", e)
+        return {formation_name: FAILED for formation_name, _, _ in formations}
+
+    report = {}
+    for formation_name, code, _ in formations:
+        calendar = calendars.get(code)
+        if calendar is None:
+            logger.error("Pas de calendrier valide pour %s (code: %s)", formation_name, code)
+            report[formation_name] = FAILED
+            continue
+        fname = calendar_path(formation_name, code, out_dir)
+        state = load_state(fname) if os.path.exists(fname) else {}
+        report[formation_name] = store_calendar(fname, calendar, state)
+    return report
+
+
+def load_manifest(path=DEFAULT_MANIFEST):
+    """
+    Charge le manifeste des formations à rafraîchir (JSON, ou YAML si PyYAML
+    est installé). Chaque entrée de `formations` hérite des valeurs de
+    `defaults` : name, code, start, end, projectId, ttl_hours, out_dir, et
+    éventuellement output (chemin du fichier ics), window et future_only.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+
+    defaults = manifest.get("defaults", {})
+    manifest["formations"] = [dict(defaults, **entry) for entry in manifest.get("formations", [])]
+    return manifest
+
+
+def entry_path(entry):
+    """Chemin du fichier ics d'une entrée du manifeste."""
+    return entry.get("output") or calendar_path(entry["name"], entry["code"], entry.get("out_dir", "."))
+
+
+def is_fresh(entry, now=None):
+    """Indique si le dernier rafraîchissement réussi d'une entrée date de moins de `ttl_hours`."""
+    fname = entry_path(entry)
+    ttl = entry.get("ttl_hours")
+    if not ttl or not os.path.exists(fname):
+        return False
+    fetched_at = load_state(fname).get("fetched_at", 0)
+    return (now or time.time()) - fetched_at < ttl * 3600
+
+
+def refresh_entry(entry):
+    """Rafraîchit une entrée du manifeste et retourne sa ligne du bilan."""
+    started = time.time()
+    status, fname = refresh_formation_calendar(
+        entry["name"], str(entry["code"]),
+        start=entry.get("start", DEFAULT_START),
+        end=entry.get("end", DEFAULT_END),
+        year=entry.get("projectId", DEFAULT_YEAR),
+        fiche_etalon=entry.get("fiche_etalon", FICHE_ETALON),
+        window=entry.get("window"),
+        future_only=entry.get("future_only", False),
+        fname=entry_path(entry),
+    )
+    return {
+        "name": entry["name"],
+        "code": str(entry["code"]),
+        "status": status,
+        "file": fname,
+        "duration": round(time.time() - started, 3),
+    }
+
+
+def run_builders(builders):
+    """
+    Relance les scripts de construction des calendriers LOGOS, chacun depuis
+    son propre répertoire (ils lisent leurs sources en chemins relatifs).
+
+    Returns:
+        list: Une entrée par script, avec son code de retour
+    """
+    results = []
+    for builder in builders:
+        directory, script = os.path.split(builder)
+        returncode = subprocess.call([sys.executable, script], cwd=directory or ".")
+        results.append({"builder": builder, "returncode": returncode})
+    return results
+
+
+def refresh_manifest(manifest, workers=4, force=False, only=None, rebuild=True, store=None):
+    """
+    Rafraîchit en parallèle toutes les formations d'un manifeste.
+
+    Les entrées dont le TTL n'a pas expiré sont ignorées (sauf `force`), les
+    autres sont rafraîchies par au plus `workers` threads. Les scripts listés
+    dans `builders` ne sont relancés que si au moins un calendrier a changé.
+
+    Args:
+        manifest (dict): Manifeste chargé par `load_manifest`
+        workers (int): Nombre maximal de rafraîchissements simultanés
+        force (bool): Ignore les TTL
+        only (list): Noms des formations à rafraîchir (toutes par défaut)
+        rebuild (bool): Autorise la reconstruction des calendriers LOGOS
+        store (EventStore): Stockage dédoublonné où ranger les calendriers
+                            modifiés (voir `event_store`)
+
+    Returns:
+        dict: Bilan du rafraîchissement, sérialisable en JSON
+    """
+    started = time.time()
+    entries = [entry for entry in manifest["formations"] if not only or entry["name"] in only]
+    pending = [entry for entry in entries if force or not is_fresh(entry, started)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(refresh_entry, pending))
+
+    if store is not None:
+        for result in results:
+            if result["status"] == UPDATED or (result["status"] == UNCHANGED and store.refs(result["code"]) is None):
+                with open(result["file"], 'r', encoding='utf-8') as f:
+                    store.put_calendar(result["code"], f.read())
+
+    refreshed = {result["name"] for result in results}
+    for entry in entries:
+        if entry["name"] not in refreshed:
+            results.append({"name": entry["name"], "code": str(entry["code"]), "status": SKIPPED,
+                            "file": entry_path(entry), "duration": 0.0})
+
+    summary = {
+        "started_at": started,
+        "duration": round(time.time() - started, 3),
+        "counts": {status: sum(1 for r in results if r["status"] == status)
+                   for status in (UPDATED, UNCHANGED, FAILED, SKIPPED)},
+        "formations": results,
+        "builders": [],
+    }
+
+    if rebuild and summary["counts"][UPDATED]:
+        summary["builders"] = run_builders(manifest.get("builders", []))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rafraîchit les calendriers ADE des formations du manifeste.")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="Manifeste des formations (JSON ou YAML)")
+    parser.add_argument("--workers", type=int, default=4, help="Nombre de rafraîchissements simultanés")
+    parser.add_argument("--force", action="store_true", help="Ignore les TTL et rafraîchit tout")
+    parser.add_argument("--only", nargs="+", help="Noms des formations à rafraîchir")
+    parser.add_argument("--no-rebuild", action="store_true", help="Ne relance pas les scripts LOGOS")
+    parser.add_argument("--summary", help="Fichier où écrire le bilan JSON (sinon sur la sortie standard)")
+    parser.add_argument("--cache", help="Cache local des réponses ADE (fichier SQLite)")
+    parser.add_argument("--offline", action="store_true", help="Ne sert que le cache, sans interroger ADE")
+    parser.add_argument("--store", help="Range aussi les calendriers dans ce stockage dédoublonné (fichier SQLite)")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+
+    setup_logging_from_args(args)
+
+    if args.cache or args.offline:
+        configure_cache(args.cache or DEFAULT_CACHE, offline=args.offline)
+
+    store = EventStore(args.store) if args.store else None
+    summary = refresh_manifest(load_manifest(args.manifest), workers=args.workers, force=args.force,
+                               only=args.only, rebuild=not args.no_rebuild, store=store)
+    if store is not None:
+        store.close()
+
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+    if summary["counts"][FAILED]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Lecture des événements d'un emploi du temps ADE, commune aux pages web, à
+l'export texte (`affiche.py`) et aux scripts de construction des calendriers
+(`masters/logos_M*.py`).
+
+Les fichiers ADE donnent les horaires en UTC (ou avec un TZID) : ils sont
+ramenés ici, et seulement ici, à l'heure de Paris sans fuseau, heure d'été
+comprise. Les événements sont produits à la demande : un appelant qui n'a
+besoin que de quelques événements peut s'arrêter sans lire tout le fichier.
+
+    for evenement in iter_events("masters/M1_LOGOS.ics", start, end):
+        print(evenement.start, evenement.title)
+"""
+import datetime
+from collections import namedtuple
+from zoneinfo import ZoneInfo
+
+from ade_parser import open_calendar, iter_vevent_lines, read_event
+
+LOCAL_TIMEZONE = ZoneInfo("Europe/Paris")
+
+# Événement normalisé : `start` et `end` sont des datetime en heure locale
+# sans fuseau (minuit pour un événement sur la journée, `end` peut valoir None)
+CalendarEvent = namedtuple("CalendarEvent", "uid title start end description location all_day recurrent")
+
+
+def to_local(value):
+    """
+    Date ou datetime d'un événement en datetime local sans fuseau : les
+    datetime avec fuseau sont convertis à l'heure de Paris, les dates
+    donnent minuit, les datetime flottants sont gardés tels quels.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, datetime.datetime):
+        return datetime.datetime.combine(value, datetime.time.min)
+    if value.tzinfo is not None:
+        return value.astimezone(LOCAL_TIMEZONE).replace(tzinfo=None)
+    return value
+
+
+def normalize(event):
+    """`CalendarEvent` tiré d'un `ade_parser.Event`, ou None s'il n'a pas de début."""
+    if not event.start:
+        return None
+    return CalendarEvent(
+        uid=event.uid or '',
+        title=event.summary if event.summary is not None else 'Sans titre',
+        start=to_local(event.start),
+        end=to_local(event.end),
+        description=event.description or '',
+        location=event.location or '',
+        all_day=not isinstance(event.start, datetime.datetime),
+        recurrent=event.recurrent,
+    )
+
+
+def overlaps(event, start=None, end=None):
+    """L'événement chevauche [start, end[ (None pour une borne ouverte)."""
+    if end is not None and event.start >= end:
+        return False
+    if start is not None:
+        return (event.end or event.start) > start or event.start >= start
+    return True
+
+
+def iter_entries(path, start=None, end=None):
+    """
+    Comme `iter_events`, avec les lignes logiques de chaque VEVENT, pour les
+    scripts qui recopient des événements (voir `ade_parser.event_component`).
+
+    Yields:
+        tuple: (`CalendarEvent`, lignes du VEVENT)
+    """
+    start, end = to_local(start), to_local(end)
+    with open_calendar(path) as f:
+        for lines in iter_vevent_lines(f):
+            event = normalize(read_event(lines))
+            if event is not None and overlaps(event, start, end):
+                yield event, lines
+
+
+def iter_events(path, start=None, end=None):
+    """
+    Événements d'un fichier ics qui chevauchent [start, end[, dans l'ordre
+    du fichier.
+
+    Args:
+        path (str): Fichier ics
+        start, end (date|datetime): Bornes de la plage (heure locale), None
+                                    pour une plage ouverte
+
+    Yields:
+        CalendarEvent: Événements, lus au fur et à mesure
+    """
+    for event, _ in iter_entries(path, start, end):
+        yield event
+
+
+def fullcalendar_event(event, **extra):
+    """Événement au format attendu par FullCalendar, avec les champs `extra` en plus."""
+    def iso(value):
+        if value is None:
+            return None
+        return value.date().isoformat() if event.all_day else value.isoformat()
+
+    data = {
+        'id': event.uid,
+        'title': event.title,
+        'start': iso(event.start),
+        'end': iso(event.end),
+        'description': event.description,
+        'location': event.location,
+        'allDay': event.all_day,
+    }
+    data.update(extra)
+    return data
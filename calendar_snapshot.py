@@ -0,0 +1,229 @@
+"""
+Cache en mémoire des calendriers analysés, pour les routes de l'emploi du temps.
+
+Un calendrier n'est réanalysé que lorsque son fichier change (date de
+modification ou taille). L'instantané garde la liste des événements et leur
+sérialisation JSON, prête à être renvoyée telle quelle ; le nouvel
+instantané remplace l'ancien d'un seul coup, une requête en cours garde
+celui qu'elle a obtenu. Si la lecture échoue, l'ancien instantané reste
+servi et la lecture est retentée à la requête suivante.
+
+Les événements y sont aussi triés par début, chacun déjà sérialisé : les
+événements d'une plage de dates (la semaine affichée par FullCalendar) se
+trouvent par dichotomie et leur JSON est assemblé sans réencodage.
+
+Chaque réponse (calendrier entier ou plage) a un ETag fort, calculable sans
+toucher aux événements, et ses variantes gzip (et brotli si le module est
+installé) sont compressées une seule fois puis gardées avec l'instantané.
+"""
+import bisect
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from calendar_events import to_local
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel, seul gzip est alors proposé
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Encodages proposés, du préféré au moins bon
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Nombre de plages dont la réponse est gardée par instantané
+MAX_PAYLOADS = 64
+
+
+def parse_local(value):
+    """
+    Date ISO 8601 (`2025-03-10`, `2025-03-10T00:00:00+01:00`,
+    `2025-03-10T23:15:00.000Z`...) en heure de Paris sans fuseau, comme les
+    événements (voir `calendar_events.to_local`). Une valeur avec décalage
+    horaire est convertie, une valeur sans décalage est déjà locale.
+
+    Raises:
+        ValueError: si la valeur n'est pas une date ISO 8601
+    """
+    # Un "+" non encodé dans l'URL arrive sous forme d'espace
+    return to_local(datetime.datetime.fromisoformat(value.strip().replace(" ", "+")))
+
+
+def compress(body, encoding):
+    """`body` compressé avec `encoding` (`gzip` ou `br`)."""
+    if encoding == "br":
+        return brotli.compress(body)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def encoded_etag(etag, encoding):
+    """ETag d'une variante compressée (un ETag fort change avec l'encodage)."""
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+class Payload:
+    """
+    Réponse JSON prête à l'envoi.
+
+    Attributes:
+        body (bytes): Corps non compressé
+        etag (str): ETag du corps non compressé (sans guillemets)
+        encoded (dict): Encodage -> corps compressé, pour chaque encodage de `ENCODINGS`
+    """
+
+    __slots__ = ("body", "etag", "encoded")
+
+    def __init__(self, body, etag):
+        self.body = body
+        self.etag = etag
+        self.encoded = {encoding: compress(body, encoding) for encoding in ENCODINGS}
+
+
+class Snapshot:
+    """
+    Calendrier analysé à une version donnée de sa source.
+
+    Attributes:
+        key: Fichier source (ou autre clé passée à `SnapshotCache.get`)
+        version (tuple): Version de la source, None si elle est absente
+        events (list): Événements renvoyés par le chargeur (dictionnaires avec
+                       `start` et `end` au format ISO 8601)
+        body (bytes): `events` sérialisés en JSON (UTF-8)
+        digest (str): Empreinte de `body`, ETag du calendrier entier
+    """
+
+    __slots__ = ("key", "version", "events", "body", "digest", "_starts", "_ends", "_chunks", "_longest",
+                 "_undated", "_payloads")
+
+    def __init__(self, key, version, events):
+        self.key = key
+        self.version = version
+        self.events = events
+
+        chunks = [encode(event) for event in events]
+        self.body = b"[" + b",".join(chunks) + b"]"
+        self.digest = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+
+        # Index trié par début ; la fin d'un événement sans fin est son début.
+        # Un événement aux dates illisibles est renvoyé pour toute plage.
+        indexed = []
+        self._undated = []
+        for event, chunk in zip(events, chunks):
+            try:
+                start = parse_local(event["start"])
+                end = parse_local(event["end"]) if event.get("end") else start
+            except (KeyError, TypeError, ValueError):
+                self._undated.append(chunk)
+                continue
+            indexed.append((start, max(start, end), chunk))
+        indexed.sort(key=lambda item: item[0])
+        self._starts = [start for start, _, _ in indexed]
+        self._ends = [end for _, end, _ in indexed]
+        self._chunks = [chunk for _, _, chunk in indexed]
+        # Durée du plus long événement : aucun événement commencé avant
+        # `start - _longest` ne peut encore être en cours à `start`
+        self._longest = max((end - start for start, end, _ in indexed), default=datetime.timedelta(0))
+        self._payloads = {}
+
+    def between(self, start=None, end=None):
+        """
+        Événements qui chevauchent [start, end[ (bornes naïves, None pour une
+        plage ouverte), triés par début.
+
+        Returns:
+            list: Événements sérialisés en JSON (bytes), un par événement
+        """
+        low = 0 if start is None else bisect.bisect_left(self._starts, start - self._longest)
+        high = len(self._starts) if end is None else bisect.bisect_left(self._starts, end)
+        if start is None:
+            return self._chunks[low:high] + self._undated
+        return [self._chunks[i] for i in range(low, high)
+                if self._ends[i] > start or self._starts[i] >= start] + self._undated
+
+    def body_between(self, start=None, end=None):
+        """Comme `between`, sous forme d'un tableau JSON (bytes) ; `body` si la plage est ouverte."""
+        if start is None and end is None:
+            return self.body
+        return b"[" + b",".join(self.between(start, end)) + b"]"
+
+    def etag(self, start=None, end=None):
+        """ETag de la réponse pour une plage, calculé sans parcourir les événements."""
+        if start is None and end is None:
+            return self.digest
+        bounds = f"{self.digest}:{start and start.isoformat()}:{end and end.isoformat()}"
+        return hashlib.blake2b(bounds.encode("ascii"), digest_size=16).hexdigest()
+
+    def payload(self, start=None, end=None):
+        """Réponse (`Payload`) pour une plage, construite et compressée à la première demande."""
+        payload = self._payloads.get((start, end))
+        if payload is None:
+            payload = Payload(self.body_between(start, end), self.etag(start, end))
+            # Au-delà de MAX_PAYLOADS plages, on repart de zéro plutôt que de tenir un LRU
+            if len(self._payloads) >= MAX_PAYLOADS:
+                self._payloads = {}
+            self._payloads[(start, end)] = payload
+        return payload
+
+
+def encode(event):
+    """Un événement en JSON compact (UTF-8)."""
+    return json.dumps(event, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def file_version(path):
+    """(date de modification en ns, taille) d'un fichier, ou None s'il n'existe pas."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SnapshotCache:
+    """
+    Instantanés par source, utilisables depuis plusieurs threads.
+
+    Args:
+        loader: Fonction qui reçoit une clé (le chemin d'un fichier par
+                défaut) et retourne la liste de ses événements (ex.
+                `charger_calendrier`) ; une exception n'est pas mise en cache
+        version: Fonction qui reçoit la même clé et retourne la version de la
+                 source, None si elle est absente (par défaut `file_version`)
+    """
+
+    def __init__(self, loader, version=file_version):
+        self.loader = loader
+        self.version = version
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Instantané à jour de la source `key`, reconstruit seulement si elle a changé."""
+        version = self.version(key)
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        # Un seul thread reconstruit l'instantané, les autres attendent puis le réutilisent
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is None or snapshot.version != version:
+                try:
+                    events = self.loader(key) if version is not None else []
+                except Exception as e:
+                    # Ancien instantané (ou aucun événement) jusqu'à une lecture réussie
+                    logger.error("Erreur lors de la lecture de %s: %s", key, e)
+                    return snapshot if snapshot is not None else Snapshot(key, None, [])
+                snapshot = Snapshot(key, version, events)
+                self._snapshots[key] = snapshot
+        return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._snapshots = {}
@@ -1,12 +1,17 @@
 import os
 import json
-import icalendar
+import logging
+from calendar_events import iter_events, fullcalendar_event
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 from course_data import COURSES, USERS
+from formation_index import get_index, DEFAULT_FORMATIONS
+from ade_logging import setup_logging
+from calendar_snapshot import SnapshotCache, ENCODINGS, encoded_etag, file_version, parse_local
 import datetime
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
 app.secret_key = 'logos_master_app_secret_key'  # Clé secrète pour les sessions
 
 # Persistence du stockage des utilisateurs
@@ -774,54 +779,52 @@ def charger_calendrier(chemin_fichier_ics):
     
     Returns:
         list: Liste des événements formatés
+
+    Raises:
+        Exception: si le fichier ne peut pas être lu ; `SnapshotCache` garde
+                   alors le calendrier précédent
     """
-    try:
-        # Lecture du fichier ICS
-        with open(chemin_fichier_ics, 'rb') as fichier:
-            cal = icalendar.Calendar.from_ical(fichier.read())
-        
-        # Extraction des événements
-        evenements = []
-        for composant in cal.walk():
-            if composant.name == "VEVENT":
-                debut = composant.get('dtstart')
-                if debut:
-                    debut_dt = debut.dt
-                    # Convertir en datetime si c'est une date
-                    if isinstance(debut_dt, datetime.date) and not isinstance(debut_dt, datetime.datetime):
-                        debut_dt = datetime.datetime.combine(debut_dt, datetime.time.min)
-                    
-                    # Gestion des fuseaux horaires (conversion en heure locale et correction du décalage)
-                    if hasattr(debut_dt, 'tzinfo') and debut_dt.tzinfo is not None:
-                        # Correction du décalage horaire - ajout de 2 heures (les horaires sont en UTC)
-                        debut_dt = debut_dt.astimezone(datetime.timezone.utc) + datetime.timedelta(hours=2)
-                        debut_dt = debut_dt.replace(tzinfo=None)
-                    
-                    fin_dt = None
-                    if composant.get('dtend'):
-                        fin_dt = composant.get('dtend').dt
-                        if hasattr(fin_dt, 'tzinfo') and fin_dt.tzinfo is not None:
-                            # Correction du décalage horaire - ajout de 2 heures
-                            fin_dt = fin_dt.astimezone(datetime.timezone.utc) + datetime.timedelta(hours=2)
-                            fin_dt = fin_dt.replace(tzinfo=None)
-                    
-                    # Ajouter l'événement à la liste
-                    evenements.append({
-                        'id': str(composant.get('uid', '')),
-                        'title': str(composant.get('summary', 'Sans titre')),
-                        'start': debut_dt.isoformat(),
-                        'end': fin_dt.isoformat() if fin_dt else None,
-                        'description': str(composant.get('description', '')),
-                        'location': str(composant.get('location', '')),
-                        'allDay': not isinstance(debut_dt, datetime.datetime),
-                        'isCustom': False
-                    })
-        
-        return evenements
+    # Horaires en heure de Paris (voir calendar_events)
+    return [fullcalendar_event(evenement, isCustom=False) for evenement in iter_events(chemin_fichier_ics)]
+
+# Calendriers analysés, réanalysés seulement quand le fichier ICS change
+calendriers = SnapshotCache(charger_calendrier)
+
+def lire_plage():
+    """
+    Plage de dates demandée par FullCalendar (paramètres start et end).
     
-    except Exception as e:
-        print(f"Erreur lors de l'analyse du fichier ICS: {e}")
-        return []
+    Returns:
+        tuple: (début, fin) en heure locale, None pour une borne absente
+    
+    Raises:
+        ValueError: si une borne n'est pas une date ISO 8601
+    """
+    debut = parse_local(request.args['start']) if request.args.get('start') else None
+    fin = parse_local(request.args['end']) if request.args.get('end') else None
+    return debut, fin
+
+def reponse_instantane(instantane, debut=None, fin=None):
+    """
+    Réponse JSON des événements d'un instantané sur une plage : 304 si le
+    navigateur a déjà cette version (If-None-Match), sinon la variante
+    compressée qu'il accepte, compressée une seule fois par instantané.
+    """
+    encodage = next((encodage for encodage in ENCODINGS if request.accept_encodings[encodage]), None)
+    etag = encoded_etag(instantane.etag(debut, fin), encodage)
+    if request.if_none_match.contains(etag):
+        reponse = app.response_class(status=304)
+    else:
+        contenu = instantane.payload(debut, fin)
+        reponse = app.response_class(contenu.encoded[encodage] if encodage else contenu.body,
+                                     mimetype='application/json')
+        if encodage:
+            reponse.headers['Content-Encoding'] = encodage
+    reponse.set_etag(etag)
+    # Le navigateur garde la réponse mais la revalide à chaque fois
+    reponse.headers['Cache-Control'] = 'private, no-cache'
+    reponse.vary.add('Accept-Encoding')
+    return reponse
 
 # Chemin de stockage pour les événements personnalisés
 CUSTOM_EVENTS_DIR = 'custom_events'
@@ -831,9 +834,13 @@ CUSTOM_EVENTS_M2 = os.path.join(CUSTOM_EVENTS_DIR, 'M2_custom_events.json')
 # S'assurer que le répertoire d'événements personnalisés existe
 os.makedirs(CUSTOM_EVENTS_DIR, exist_ok=True)
 
+def custom_events_path(niveau):
+    """Fichier JSON des événements personnalisés d'un niveau."""
+    return CUSTOM_EVENTS_M1 if niveau == 'm1' else CUSTOM_EVENTS_M2
+
 def load_custom_events(niveau):
     """Charge les événements personnalisés depuis un fichier JSON."""
-    file_path = CUSTOM_EVENTS_M1 if niveau == 'm1' else CUSTOM_EVENTS_M2
+    file_path = custom_events_path(niveau)
     if not os.path.exists(file_path):
         return []
     
@@ -843,20 +850,34 @@ def load_custom_events(niveau):
     except json.JSONDecodeError:
         return []
     except Exception as e:
-        print(f"Erreur lors du chargement des événements personnalisés: {e}")
+        logger.error("Erreur lors du chargement des événements personnalisés: %s", e)
         return []
 
 def save_custom_events(events, niveau):
     """Sauvegarde les événements personnalisés dans un fichier JSON."""
-    file_path = CUSTOM_EVENTS_M1 if niveau == 'm1' else CUSTOM_EVENTS_M2
+    file_path = custom_events_path(niveau)
     try:
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(events, f, ensure_ascii=False, indent=4)
         return True
     except Exception as e:
-        print(f"Erreur lors de la sauvegarde des événements personnalisés: {e}")
+        logger.error("Erreur lors de la sauvegarde des événements personnalisés: %s", e)
         return False
 
+def load_all_custom_events(_cle=None):
+    """Événements personnalisés des deux niveaux, sans doublons."""
+    # Éliminer les doublons (événements qui existent dans les deux niveaux)
+    all_events = {}
+    for event in load_custom_events('m1') + load_custom_events('m2'):
+        all_events[event.get('id')] = event
+    return list(all_events.values())
+
+# Événements personnalisés par niveau et pour les deux niveaux, relus
+# seulement quand leurs fichiers JSON changent
+evenements_perso = SnapshotCache(load_custom_events, version=lambda niveau: file_version(custom_events_path(niveau)))
+tous_evenements_perso = SnapshotCache(load_all_custom_events,
+                                      version=lambda _cle: (file_version(CUSTOM_EVENTS_M1), file_version(CUSTOM_EVENTS_M2)))
+
 def sync_custom_events_to_ics():
     """Synchronise les événements personnalisés avec les fichiers ICS."""
     # Créer un fichier JSON au même format que ceux utilisés par les scripts logos_M1.py et logos_M2.py
@@ -914,7 +935,7 @@ def sync_custom_events_to_ics():
         
         return True
     except Exception as e:
-        print(f"Erreur lors de la synchronisation des événements personnalisés: {e}")
+        logger.error("Erreur lors de la synchronisation des événements personnalisés: %s", e)
         return False
 
 # Nouvelle route pour l'emploi du temps
@@ -964,9 +985,14 @@ def get_events(niveau):
     # Choisir le bon fichier ICS en fonction du niveau
     chemin_fichier_ics = os.path.join('masters', f"M{'1' if niveau == 'm1' else '2'}_LOGOS.ics")
     
-    # Charger les événements du calendrier
-    evenements = charger_calendrier(chemin_fichier_ics)
-    return jsonify(evenements)
+    # Plage affichée par FullCalendar (paramètres start et end), toute l'année sinon
+    try:
+        debut, fin = lire_plage()
+    except ValueError:
+        return jsonify({'error': 'Plage de dates non valide.'}), 400
+    
+    # Événements du calendrier, déjà sérialisés tant que le fichier n'a pas changé
+    return reponse_instantane(calendriers.get(chemin_fichier_ics), debut, fin)
 
 # API pour ajouter un événement personnalisé (admin uniquement)
 @app.route('/api/add_custom_event', methods=['POST'])
@@ -1134,16 +1160,13 @@ def get_all_custom_events():
     if 'username' not in session or not session.get('is_admin', False):
         return jsonify({'error': 'Vous n\'avez pas les droits nécessaires.'}), 403
     
-    # Combiner les événements des deux niveaux
-    events_m1 = load_custom_events('m1')
-    events_m2 = load_custom_events('m2')
-    
-    # Éliminer les doublons (événements qui existent dans les deux niveaux)
-    all_events = {}
-    for event in events_m1 + events_m2:
-        all_events[event.get('id')] = event
+    try:
+        debut, fin = lire_plage()
+    except ValueError:
+        return jsonify({'error': 'Plage de dates non valide.'}), 400
     
-    return jsonify(list(all_events.values()))
+    # Combiner les événements des deux niveaux
+    return reponse_instantane(tous_evenements_perso.get('tous'), debut, fin)
 
 # API pour récupérer les événements personnalisés pour un niveau spécifique
 @app.route('/api/custom_events/<niveau>')
@@ -1154,13 +1177,48 @@ def get_custom_events(niveau):
     if niveau not in ['m1', 'm2']:
         return jsonify({'error': 'Niveau non valide.'}), 400
     
+    try:
+        debut, fin = lire_plage()
+    except ValueError:
+        return jsonify({'error': 'Plage de dates non valide.'}), 400
+    
     # Charger les événements du niveau spécifié
-    events = load_custom_events(niveau)
+    return reponse_instantane(evenements_perso.get(niveau), debut, fin)
+
+# API pour retrouver les codes ADE d'une formation (admin uniquement)
+@app.route('/api/formations/codes')
+def get_formation_codes():
+    if 'username' not in session or not session.get('is_admin', False):
+        return jsonify({'error': 'Vous n\'avez pas les droits nécessaires.'}), 403
+    
+    name = request.args.get('name', '')
+    if not name.strip():
+        return jsonify({'error': 'Paramètre name manquant.'}), 400
+    if not os.path.exists(DEFAULT_FORMATIONS):
+        return jsonify({'error': 'Aucun scan des formations disponible.'}), 404
     
-    return jsonify(events)
+    return jsonify({'name': name, 'codes': get_index().codes_for(name)})
+
+# API d'autocomplétion des noms de formation (admin uniquement)
+@app.route('/api/formations/search')
+def search_formations():
+    if 'username' not in session or not session.get('is_admin', False):
+        return jsonify({'error': 'Vous n\'avez pas les droits nécessaires.'}), 403
+    
+    prefix = request.args.get('prefix', '')
+    limit = request.args.get('limit', 50, type=int)
+    if not os.path.exists(DEFAULT_FORMATIONS):
+        return jsonify({'error': 'Aucun scan des formations disponible.'}), 404
+    
+    # Chaque formation proposée est accompagnée de ses codes ADE
+    index = get_index()
+    return jsonify([{'name': name, 'codes': index.codes_for(name)}
+                    for name in index.search_prefix(prefix, limit)])
 
 # Initialisation de l'application
 if __name__ == '__main__':
+    setup_logging("INFO")
+    
     # Si le fichier users.json n'existe pas, créer un utilisateur par défaut
     if not os.path.exists(USERS_FILE):
         # Initialiser avec un utilisateur par défaut
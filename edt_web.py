@@ -1,61 +1,30 @@
-import icalendar
-import datetime
+from calendar_events import iter_events, fullcalendar_event
+from calendar_snapshot import parse_local
+from ade_logging import setup_logging
+import logging
 import os
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, request, jsonify
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
-def charger_calendrier(chemin_fichier_ics):
+def charger_calendrier(chemin_fichier_ics, debut=None, fin=None):
     """
     Lit un fichier ICS et retourne les événements du calendrier.
     
     Args:
         chemin_fichier_ics (str): Chemin vers le fichier ICS
+        debut, fin (datetime): Plage de dates à retourner (tout le calendrier par défaut)
     
     Returns:
         list: Liste des événements formatés
     """
     try:
-        # Lecture du fichier ICS
-        with open(chemin_fichier_ics, 'rb') as fichier:
-            cal = icalendar.Calendar.from_ical(fichier.read())
-        
-        # Extraction des événements
-        evenements = []
-        for composant in cal.walk():
-            if composant.name == "VEVENT":
-                debut = composant.get('dtstart')
-                if debut:
-                    debut_dt = debut.dt
-                    # Convertir en datetime si c'est une date
-                    if isinstance(debut_dt, datetime.date) and not isinstance(debut_dt, datetime.datetime):
-                        debut_dt = datetime.datetime.combine(debut_dt, datetime.time.min)
-                    
-                    # Gestion des fuseaux horaires (conversion en heure locale)
-                    if hasattr(debut_dt, 'tzinfo') and debut_dt.tzinfo is not None:
-                        debut_dt = debut_dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
-                    
-                    fin_dt = None
-                    if composant.get('dtend'):
-                        fin_dt = composant.get('dtend').dt
-                        if hasattr(fin_dt, 'tzinfo') and fin_dt.tzinfo is not None:
-                            fin_dt = fin_dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
-                    
-                    # Ajouter l'événement à la liste
-                    evenements.append({
-                        'id': str(composant.get('uid', '')),
-                        'title': str(composant.get('summary', 'Sans titre')),
-                        'start': debut_dt.isoformat(),
-                        'end': fin_dt.isoformat() if fin_dt else None,
-                        'description': str(composant.get('description', '')),
-                        'location': str(composant.get('location', '')),
-                        'allDay': not isinstance(debut_dt, datetime.datetime)
-                    })
-        
-        return evenements
+        # Horaires en heure de Paris (voir calendar_events)
+        return [fullcalendar_event(evenement) for evenement in iter_events(chemin_fichier_ics, debut, fin)]
     
     except Exception as e:
-        print(f"Erreur lors de l'analyse du fichier ICS: {e}")
+        logger.error("Erreur lors de l'analyse du fichier ICS %s: %s", chemin_fichier_ics, e)
         return []
 
 @app.route('/')
@@ -65,10 +34,19 @@ def index():
 @app.route('/api/events')
 def get_events():
     chemin_fichier_ics = os.path.join('masters', 'M2_LOGOS.ics')
-    evenements = charger_calendrier(chemin_fichier_ics)
+    
+    # Plage affichée par FullCalendar (paramètres start et end), toute l'année sinon
+    try:
+        debut = parse_local(request.args['start']) if request.args.get('start') else None
+        fin = parse_local(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'Plage de dates non valide.'}), 400
+    
+    evenements = charger_calendrier(chemin_fichier_ics, debut, fin)
     return jsonify(evenements)
 
 if __name__ == "__main__":
+    setup_logging("INFO")
     # Création des répertoires pour les templates s'ils n'existent pas
     os.makedirs('templates', exist_ok=True)
     os.makedirs('static', exist_ok=True)
@@ -0,0 +1,228 @@
+"""
+Stockage dédoublonné (SQLite) des événements ADE de plusieurs formations.
+
+Beaucoup de codes partagent les mêmes cours (cours mutualisés entre
+parcours). Chaque événement est identifié par l'empreinte de sa forme
+normalisée (voir `ade_ics.normalize_event`) et stocké une seule fois ; le
+calendrier d'un code n'est plus qu'une liste de références vers ces
+événements, plus son en-tête et son pied. Le `.ics` est reconstruit à la
+demande.
+
+    python event_store.py import CODE fichier.ics
+    python event_store.py export CODE fichier.ics
+    python event_store.py relations
+    python event_store.py stats [--gc]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+
+from ade_client import temp_file_for
+from ade_ics import split_calendar, normalize_event, join_calendar
+
+DEFAULT_STORE = "ade_events.sqlite"
+
+# Relations entre calendriers rapportées par `EventStore.relations`
+EQUAL = "equal"
+SUBSET = "subset"
+
+
+def event_digest(lines):
+    """Empreinte SHA-256 de la forme normalisée d'un événement."""
+    return hashlib.sha256(normalize_event(lines).encode("utf-8")).hexdigest()
+
+
+class EventStore:
+    """
+    Événements partagés entre calendriers, utilisables depuis plusieurs threads.
+
+    Args:
+        path (str): Fichier SQLite du stockage
+    """
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS events (hash TEXT PRIMARY KEY, body BLOB, size INTEGER)")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS calendars (
+                code TEXT PRIMARY KEY, header TEXT, footer TEXT, refs TEXT, updated_at REAL
+            )
+        """)
+        self.db.commit()
+
+    def put_calendar(self, code, text):
+        """
+        Range le calendrier d'un code ; seuls les événements encore inconnus
+        sont ajoutés.
+
+        Returns:
+            tuple: (nombre d'événements nouveaux, nombre d'événements du calendrier)
+        """
+        header, events, footer = split_calendar(text)
+        refs = []
+        rows = []
+        for event in events:
+            digest = event_digest(event)
+            body = "\n".join(event).encode("utf-8")
+            refs.append(digest)
+            rows.append((digest, zlib.compress(body), len(body)))
+
+        with self.lock:
+            added = 0
+            for row in rows:
+                added += self.db.execute("INSERT OR IGNORE INTO events VALUES (?, ?, ?)", row).rowcount
+            self.db.execute("INSERT OR REPLACE INTO calendars VALUES (?, ?, ?, ?, ?)",
+                            (str(code), "\n".join(header), "\n".join(footer), json.dumps(refs), time.time()))
+            self.db.commit()
+        return added, len(refs)
+
+    def refs(self, code):
+        """Empreintes des événements d'un code, dans l'ordre du calendrier (None si inconnu)."""
+        with self.lock:
+            row = self.db.execute("SELECT refs FROM calendars WHERE code = ?", (str(code),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def build_calendar(self, code):
+        """Reconstruit le texte du calendrier d'un code, ou None s'il n'est pas stocké."""
+        with self.lock:
+            row = self.db.execute("SELECT header, footer, refs FROM calendars WHERE code = ?",
+                                  (str(code),)).fetchone()
+            if row is None:
+                return None
+            header, footer, refs = row
+            refs = json.loads(refs)
+            bodies = {}
+            for digest in set(refs):
+                body = self.db.execute("SELECT body FROM events WHERE hash = ?", (digest,)).fetchone()[0]
+                bodies[digest] = zlib.decompress(body).decode("utf-8").split("\n")
+        return join_calendar(header.split("\n") if header else [], (bodies[digest] for digest in refs),
+                             footer.split("\n") if footer else [])
+
+    def export(self, code, fname):
+        """Écrit le calendrier d'un code dans `fname` (écriture atomique). Retourne False s'il est inconnu."""
+        text = self.build_calendar(code)
+        if text is None:
+            return False
+        fd, tmp = temp_file_for(fname)
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        os.replace(tmp, fname)
+        return True
+
+    def relations(self):
+        """
+        Codes dont les événements sont tous contenus dans le calendrier d'un
+        autre code (calendriers vides exclus).
+
+        Returns:
+            list: (code, autre code, EQUAL ou SUBSET), triés ; SUBSET signifie
+                  que le calendrier du premier code est inclus dans celui du second
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT code, refs FROM calendars").fetchall()
+        sets = {code: set(json.loads(refs)) for code, refs in rows}
+
+        # Index inversé : événement -> codes qui le contiennent
+        by_event = {}
+        for code, events in sets.items():
+            for digest in events:
+                by_event.setdefault(digest, []).append(code)
+
+        relations = []
+        for code, events in sets.items():
+            if not events:
+                continue
+            shared = Counter(other for digest in events for other in by_event[digest] if other != code)
+            for other, count in shared.items():
+                if count < len(events):
+                    continue
+                if len(sets[other]) > len(events):
+                    relations.append((code, other, SUBSET))
+                elif code < other:
+                    relations.append((code, other, EQUAL))
+        return sorted(relations)
+
+    def collect_garbage(self):
+        """Supprime les événements qui ne sont plus référencés et retourne leur nombre."""
+        with self.lock:
+            referenced = set()
+            for (refs,) in self.db.execute("SELECT refs FROM calendars"):
+                referenced.update(json.loads(refs))
+            orphans = [(digest,) for (digest,) in self.db.execute("SELECT hash FROM events")
+                       if digest not in referenced]
+            self.db.executemany("DELETE FROM events WHERE hash = ?", orphans)
+            self.db.commit()
+        return len(orphans)
+
+    def stats(self):
+        """
+        Nombre de calendriers et d'événements, et taille des événements
+        stockés comparée à celle des calendriers qu'ils reconstituent.
+        """
+        with self.lock:
+            sizes = dict(self.db.execute("SELECT hash, size FROM events"))
+            calendars = [json.loads(refs) for (refs,) in self.db.execute("SELECT refs FROM calendars")]
+        return {
+            "calendars": len(calendars),
+            "events": len(sizes),
+            "references": sum(len(refs) for refs in calendars),
+            "stored_bytes": sum(sizes.values()),
+            "logical_bytes": sum(sizes.get(digest, 0) for refs in calendars for digest in refs),
+        }
+
+    def close(self):
+        self.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stockage dédoublonné des événements ADE.")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="Fichier SQLite du stockage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Range un fichier ics sous un code")
+    import_parser.add_argument("code")
+    import_parser.add_argument("file")
+    export_parser = subparsers.add_parser("export", help="Reconstruit le fichier ics d'un code")
+    export_parser.add_argument("code")
+    export_parser.add_argument("file")
+    subparsers.add_parser("relations", help="Calendriers identiques ou inclus dans un autre")
+    stats_parser = subparsers.add_parser("stats", help="Taille du stockage")
+    stats_parser.add_argument("--gc", action="store_true", help="Supprime d'abord les événements orphelins")
+    args = parser.parse_args()
+
+    store = EventStore(args.store)
+    if args.command == "import":
+        with open(args.file, "r", encoding="utf-8") as f:
+            added, total = store.put_calendar(args.code, f.read())
+        print(f"Code {args.code}: {total} événements, dont {added} nouveaux")
+    elif args.command == "export":
+        if store.export(args.code, args.file):
+            print(f"Calendrier du code {args.code} écrit dans {args.file}")
+        else:
+            print(f"Code {args.code} absent du stockage")
+    elif args.command == "relations":
+        for code, other, relation in store.relations():
+            if relation == EQUAL:
+                print(f"Code {code} = code {other}")
+            else:
+                print(f"Code {code} ⊂ code {other}")
+    else:
+        if args.gc:
+            print(f"{store.collect_garbage()} événements orphelins supprimés")
+        stats = store.stats()
+        ratio = stats["logical_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 1.0
+        print(f"{stats['calendars']} calendriers, {stats['references']} références vers "
+              f"{stats['events']} événements distincts ({stats['stored_bytes'] / 1024:.0f} Ko stockés "
+              f"pour {stats['logical_bytes'] / 1024:.0f} Ko de calendriers, x{ratio:.1f})")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,41 @@
-import requests
+import argparse
+import contextlib
+import functools
 import re
-import json
+import logging
 import time
-from concurrent.futures import ThreadPoolExecutor
+import itertools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from collections import Counter
 
-def fetch_ical(code, start="2024-08-23", end="2025-07-17", year=5, fiche_etalon="58598,"):
+from ade_client import get_client, configure_cache, is_calendar, NotACalendarError, DEFAULT_CACHE, DEFAULT_START, DEFAULT_END, DEFAULT_YEAR, FICHE_ETALON
+from ade_governor import configure as configure_governor
+from ade_ics import content_hash, calendar_stats, description_formations
+from adaptive_concurrency import AdaptiveConcurrency
+from ade_logging import ProgressReporter, add_logging_arguments, setup_logging_from_args
+from scan_pipeline import ScanPipeline
+from scan_catalog import CodeCatalog, DEFAULT_CATALOG
+from formation_index import build_index_file
+from scan_journal import (ScanJournal, AppendLog, pending_codes, parse_code_range, hits_path_for, compact_results,
+                          write_json_atomic, merge_results, parse_shard, shard_codes, shard_path, DEFAULT_JOURNAL, HIT, MISS, ERROR)
+
+logger = logging.getLogger(__name__)
+
+def fetch_ical(code, start=DEFAULT_START, end=DEFAULT_END, year=DEFAULT_YEAR, fiche_etalon=FICHE_ETALON):
     """
     Récupère le calendrier iCal pour un code de formation donné.
+    Les requêtes passent par le client ADE partagé (connexions persistantes,
+    limite de débit, nouvelles tentatives).
+
+    Lève NotACalendarError si ADE ne renvoie pas de calendrier (page de
+    maintenance, statut d'erreur) et ADEUnavailableError si ADE est resté en
+    erreur malgré les nouvelles tentatives, pour ne pas confondre une panne
+    avec un code vide.
     """
-    url = "https://adeconsult.app.u-paris.fr/jsp/custom/modules/plannings/anonymous_cal.jsp"
-    params = {
-        "calType": "ical",
-        "firstDate": start,
-        "lastDate": end,
-        "resources": fiche_etalon + str(code),
-        "projectId": year,
-    }
+    return get_client().fetch_ical(code, start, end, year, fiche_etalon)
 
-    try:
-        response = requests.get(url, params=params, timeout=10)
-        
-        # Vérifier que nous avons bien reçu un calendrier valide
-        if response.status_code == 200 and response.text.startswith("BEGIN:VCALENDAR"):
-            return response.text
-        else:
-            return None
-    except Exception as e:
-        print(f"Erreur lors de la récupération du calendrier pour le code {code}: {e}")
-        return None
+# Descriptions des événements, jusqu'à la propriété suivante
+DESCRIPTION_PATTERN = re.compile(r'DESCRIPTION:(.*?)(?:END:|UID:)', re.DOTALL)
 
 def extract_formation_name(ical_content):
     """
@@ -38,44 +45,23 @@ def extract_formation_name(ical_content):
         return None
     
     # Extraire toutes les descriptions d'événements
-    description_pattern = re.compile(r'DESCRIPTION:(.*?)(?:END:|UID:)', re.DOTALL)
-    descriptions = description_pattern.findall(ical_content)
+    descriptions = DESCRIPTION_PATTERN.findall(ical_content)
     
     if not descriptions:
         return None
     
-    # Liste pour stocker les formations trouvées dans chaque événement
-    all_formations_per_event = []
-    
-    for description in descriptions:
-        # Nettoyer la description et la diviser en lignes
-        clean_desc = description.replace('\\n', '\n')
-        lines = [line.strip() for line in clean_desc.split('\n') if line.strip()]
-        
-        # Filtrer les lignes qui semblent être des noms de formation
-        # On recherche des motifs comme "M2 DATA", "M1 INFO", etc.
-        formation_pattern = re.compile(r'^(M[1-2]|L[1-3])\s+[A-Z0-9/\-]+$')
-        alt_formation_pattern = re.compile(r'^(M[1-2]|L[1-3])\-[A-Z0-9/\-]+$')
-        
-        # Collecter les formations pour cet événement
-        event_formations = []
-        for line in lines:
-            if formation_pattern.match(line) or alt_formation_pattern.match(line):
-                event_formations.append(line)
-        
-        # Si des formations ont été trouvées pour cet événement, les ajouter à la liste
-        if event_formations:
-            all_formations_per_event.append(set(event_formations))
+    # Formations citées par chaque événement ("M2 DATA", "M1 INFO", etc.)
+    all_formations_per_event = [formations for formations in map(description_formations, descriptions) if formations]
     
     # S'il n'y a aucun événement avec des formations, retourner None
     if not all_formations_per_event:
         return None
     
     # Trouver l'intersection de toutes les formations (formations communes à tous les événements)
-    common_formations = set.intersection(*all_formations_per_event) if all_formations_per_event else set()
+    common_formations = set.intersection(*all_formations_per_event)
     
     # Si aucune formation commune n'est trouvée, essayer une approche alternative
-    if not common_formations and all_formations_per_event:
+    if not common_formations:
         # Compter la fréquence de chaque formation
         all_formations = [f for event_set in all_formations_per_event for f in event_set]
         formation_counter = Counter(all_formations)
@@ -90,10 +76,11 @@ def process_formation_code(code):
     """
     Traite un code de formation: récupère le calendrier, extrait le nom et retourne le résultat.
     """
-    print(f"Traitement du code {code}")
-    ical_content = fetch_ical(code)
-    
-    if not ical_content:
+    logger.debug("Traitement du code %s", code, extra={"code": code})
+    try:
+        ical_content = fetch_ical(code)
+    except NotACalendarError as e:
+        logger.warning("Code %s: %s", code, e, extra={"code": code})
         return None
     
     formation_names = extract_formation_name(ical_content)
@@ -103,14 +90,218 @@ def process_formation_code(code):
             "code": code,
             "formation_names": formation_names
         }
-        print(f"Code {code}: Formation trouvée - {formation_names}")
+        logger.info("Code %s: Formation trouvée - %s", code, formation_names, extra={"code": code})
         return result
     
     return None
 
+def fetch_code(code):
+    """
+    Étape réseau du scan : télécharge le calendrier d'un code.
+
+    Returns:
+        dict: Enregistrement du journal : ERROR si ADE n'a pas renvoyé de
+              calendrier valide, MISS sinon ; le calendrier reçu est placé
+              sous la clé "ical" en attendant `parse_calendar`, qui en fait
+              un HIT s'il cite une formation
+    """
+    logger.debug("Traitement du code %s", code, extra={"code": code})
+    started = time.monotonic()
+    try:
+        ical_content = fetch_ical(code)
+    except Exception as e:
+        logger.warning("Erreur lors du traitement du code %s: %s", code, e, extra={"code": code})
+        return {"code": code, "status": ERROR, "error": str(e), "error_type": type(e).__name__,
+                "latency": round(time.monotonic() - started, 3)}
+
+    return {"code": code, "status": MISS, "latency": round(time.monotonic() - started, 3), "ical": ical_content}
+
+def parse_calendar(record):
+    """
+    Étape de calcul du scan : remplace le calendrier d'un enregistrement de
+    `fetch_code` par son empreinte normalisée, ses statistiques (voir
+    `calendar_stats`) et, pour un HIT, les noms de formation. Fonction de
+    module pour pouvoir tourner dans un autre processus.
+
+    Si l'enregistrement porte l'entrée du catalogue de ce code (clé "known")
+    et que l'empreinte n'a pas changé, le calendrier n'est pas réanalysé :
+    le statut et les noms connus sont repris et l'enregistrement est marqué
+    "unchanged".
+    """
+    ical_content = record.pop("ical", None)
+    known = record.pop("known", None)
+    if ical_content is None:
+        return record
+
+    record["hash"] = content_hash(ical_content)
+    if known and known["hash"] == record["hash"]:
+        record["status"] = known["status"]
+        if known["formation_names"]:
+            record["formation_names"] = known["formation_names"]
+        record["unchanged"] = True
+        return record
+
+    record.update(calendar_stats(ical_content))
+    record["size"] = len(ical_content.encode("utf-8"))
+    formation_names = extract_formation_name(ical_content)
+    if formation_names:
+        record["status"] = HIT
+        record["formation_names"] = formation_names
+    return record
+
+def needs_parse(record):
+    return "ical" in record
+
+def scan_code(code):
+    """
+    Sonde un code pour le journal de reprise (téléchargement puis analyse).
+
+    Returns:
+        dict: Enregistrement du journal : code, statut (HIT, MISS ou ERROR),
+              empreinte normalisée du calendrier et noms de formation pour un HIT
+    """
+    return parse_calendar(fetch_code(code))
+
+def probe_then_fetch(code, windows=None):
+    """
+    Mode en deux phases : le code est d'abord sondé sur quelques semaines de
+    cours (`ADEClient.probe_events`), et seuls les codes qui ont des
+    événements passent à la récupération de l'année entière (`fetch_code`).
+
+    Un code dont les cours tombent tous hors des fenêtres de sondage est
+    enregistré comme MISS : les fenêtres doivent couvrir des semaines chargées.
+    """
+    started = time.monotonic()
+    try:
+        has_events = get_client().probe_events(code, windows)
+    except Exception as e:
+        logger.warning("Erreur lors du sondage du code %s: %s", code, e, extra={"code": code})
+        return {"code": code, "status": ERROR, "error": str(e), "error_type": type(e).__name__,
+                "latency": round(time.monotonic() - started, 3)}
+
+    if not has_events:
+        return {"code": code, "status": MISS, "probe": True, "latency": round(time.monotonic() - started, 3)}
+    return fetch_code(code)
+
+def probe_then_scan(code, windows=None):
+    """`probe_then_fetch` suivi de l'analyse du calendrier."""
+    return parse_calendar(probe_then_fetch(code, windows))
+
+def find_active_codes(codes, block_size=32):
+    """
+    Repère les codes qui ont des événements en interrogeant ADE par blocs.
+
+    Un bloc sans aucun événement élimine tous ses codes en une seule requête ;
+    un bloc qui en contient est coupé en deux jusqu'à isoler les codes actifs.
+    Un bloc en erreur (réseau, statut d'erreur, réponse qui n'est pas un
+    calendrier) est conservé en entier pour être traité code par code.
+    """
+    codes = list(codes)
+    active = []
+    blocks = [codes[i:i + block_size] for i in range(0, len(codes), block_size)]
+    while blocks:
+        block = blocks.pop()
+        try:
+            combined = get_client().fetch_batch(block)
+            if not is_calendar(combined):
+                raise NotACalendarError("Réponse vide ou qui n'est pas un calendrier")
+        except Exception as e:
+            # Sans calendrier valide, rien ne dit que le bloc est vide : il est gardé
+            logger.warning("Erreur lors du sondage des codes %s-%s: %s", block[0], block[-1], e)
+            active.extend(block)
+            continue
+
+        if "BEGIN:VEVENT" not in combined:
+            continue
+        if len(block) == 1:
+            active.append(block[0])
+        else:
+            middle = len(block) // 2
+            blocks.extend([block[middle:], block[:middle]])
+    return sorted(active)
+
+def active_codes_only(codes, block_size, journal, skipped, chunk_size=4096):
+    """
+    Filtre un flux de codes avec `find_active_codes`, par paquets de
+    `chunk_size` codes pour ne jamais matérialiser toute la plage. Les codes
+    écartés sont inscrits au journal comme MISS et ajoutés à `skipped`.
+    """
+    chunk = []
+    for code in itertools.chain(codes, [None]):
+        if code is not None:
+            chunk.append(code)
+            if len(chunk) < chunk_size:
+                continue
+        if not chunk:
+            continue
+        active = set(find_active_codes(chunk, block_size))
+        for inactive in (c for c in chunk if c not in active):
+            journal.append({"code": inactive, "status": MISS})
+            skipped.append(inactive)
+        yield from (c for c in chunk if c in active)
+        chunk = []
+
+@contextlib.contextmanager
+def open_pipeline(fetch, controller, parse_workers=None, parse_queue=64, known=None):
+    """
+    Ouvre le pipeline du scan : téléchargements dans des threads, analyse des
+    calendriers dans des processus, reliés par une file bornée (voir
+    `ScanPipeline`). La concurrence des téléchargements suit `controller`,
+    qui observe chaque tentative du régulateur d'ADE le temps du scan (voir
+    `Governor.add_observer`).
+
+    Args:
+        fetch: Étape réseau (`fetch_code` ou `probe_then_fetch`)
+        controller (AdaptiveConcurrency): Réglage de la concurrence
+        parse_workers (int): Nombre de processus d'analyse (un par cœur par défaut)
+        parse_queue (int): Nombre maximal de calendriers en attente d'analyse
+        known: Entrée du catalogue d'un code, ou None (`CodeCatalog.known`),
+               lue après chaque téléchargement pour ne pas réanalyser les
+               calendriers inchangés
+    """
+    if known is not None:
+        scan_fetch = fetch
+
+        def fetch(code):
+            record = scan_fetch(code)
+            if "ical" in record:
+                entry = known(code)
+                if entry is not None:
+                    record["known"] = entry
+            return record
+
+    governor = get_client().governor
+    governor.add_observer(controller.record)
+    try:
+        with ThreadPoolExecutor(max_workers=controller.maximum) as fetch_executor, \
+                ProcessPoolExecutor(max_workers=parse_workers) as parse_executor:
+            yield ScanPipeline(fetch_executor, parse_executor, fetch, parse_calendar, needs_parse,
+                               lambda: controller.limit, parse_queue)
+    finally:
+        governor.remove_observer(controller.record)
+
+def scan_records(pipeline, codes, catalog=None):
+    """
+    Sonde les codes avec `pipeline` et rend les enregistrements du journal
+    dans l'ordre d'achèvement, après avoir alimenté le catalogue pour les
+    calendriers reçus.
+    """
+    for code, future in pipeline.run(codes):
+        try:
+            record = future.result()
+        except Exception as e:
+            logger.warning("Erreur lors du traitement du code %s: %s", code, e, extra={"code": code})
+            record = {"code": code, "status": ERROR, "error": str(e), "error_type": type(e).__name__}
+        if catalog is not None and "hash" in record:
+            catalog.record(record)
+        # Journalisé ici : les processus d'analyse n'ont pas accès au journal
+        if record["status"] == HIT and not record.get("unchanged"):
+            logger.info("Code %s: Formation trouvée - %s", code, record["formation_names"], extra={"code": code})
+        yield record
+
 def save_results(results, filename="formations.json"):
     """
-    Sauvegarde les résultats dans un fichier JSON.
+    Sauvegarde les résultats dans un fichier JSON (écriture atomique).
     """
     # Crée un dictionnaire avec les codes comme clés
     formations_dict = {}
@@ -118,10 +309,9 @@ def save_results(results, filename="formations.json"):
         if result:
             formations_dict[str(result["code"])] = result["formation_names"]
     
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(formations_dict, f, ensure_ascii=False, indent=2)
+    write_json_atomic(filename, formations_dict)
     
-    print(f"Résultats sauvegardés dans {filename}")
+    logger.info("Résultats sauvegardés dans %s", filename)
 
 def test_single_code(code):
     """
@@ -133,52 +323,147 @@ def test_single_code(code):
     else:
         print(f"Code {code}: Aucune formation trouvée")
 
-def main():
-    # Option pour tester un seul code
-    test_code = 14629
-    test_single_code(test_code)
-    
-    # Option pour exécuter sur tous les codes
-    run_all = input("Voulez-vous exécuter l'extraction pour tous les codes (0-30000)? (o/n): ")
-    
-    if run_all.lower() != 'o':
-        print("Extraction complète annulée.")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recherche les formations associées aux codes ADE.")
+    parser.add_argument("--codes", default="0-30000", help="Plage de codes à sonder (ex. 0-30000 ou 100-200,500)")
+    parser.add_argument("--test", type=int, help="Teste l'extraction pour un seul code et s'arrête")
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL, help="Journal de reprise du scan")
+    parser.add_argument("--retry-errors", action="store_true", help="Ne relance que les codes en erreur dans le journal")
+    parser.add_argument("--output", default="formations.json", help="Fichier JSON des formations trouvées")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG,
+                        help="Catalogue SQLite des calendriers (événements, dates, taille, empreinte)")
+    parser.add_argument("--shard", metavar="I/N",
+                        help="Ne sonde que le shard I parmi N (codes congrus à I modulo N) ; "
+                             "journal et résultats sont suffixés par le shard")
+    parser.add_argument("--merge", nargs="+", metavar="FICHIER",
+                        help="Fusionne les résultats de plusieurs shards dans --output et s'arrête")
+    parser.add_argument("--compact", action="store_true",
+                        help="Régénère seulement le fichier JSON à partir des formations déjà trouvées")
+    parser.add_argument("--workers", type=int, default=10, help="Nombre de requêtes simultanées au départ")
+    parser.add_argument("--max-workers", type=int, default=64, help="Nombre maximal de requêtes simultanées")
+    parser.add_argument("--target-latency", type=float, default=2.0,
+                        help="Latence p95 visée par le réglage automatique, en secondes")
+    parser.add_argument("--fixed", action="store_true", help="Désactive le réglage automatique de la concurrence")
+    parser.add_argument("--parse-workers", type=int,
+                        help="Nombre de processus d'analyse des calendriers (par défaut, un par cœur)")
+    parser.add_argument("--parse-queue", type=int, default=64,
+                        help="Nombre maximal de calendriers en attente d'analyse avant de suspendre les téléchargements")
+    parser.add_argument("--blocks", type=int, default=0,
+                        help="Sonde d'abord les codes par blocs de cette taille (voir find_active_codes)")
+    parser.add_argument("--two-phase", action="store_true",
+                        help="Sonde chaque code sur quelques semaines avant de récupérer l'année entière")
+    parser.add_argument("--probe-window", action="append", metavar="DEBUT:FIN",
+                        help="Fenêtre de sondage du mode --two-phase (répétable, dates YYYY-MM-DD)")
+    parser.add_argument("--rate", type=float, default=20.0, help="Débit maximal vers ADE, en requêtes par seconde")
+    parser.add_argument("--cache", help="Cache local des réponses ADE (fichier SQLite)")
+    parser.add_argument("--offline", action="store_true", help="Ne sert que le cache, sans interroger ADE")
+    parser.add_argument("--progress-interval", type=float, default=10.0,
+                        help="Intervalle entre deux lignes de progression, en secondes")
+    add_logging_arguments(parser)
+    args = parser.parse_args(argv)
+
+    setup_logging_from_args(args)
+    configure_governor(rate=args.rate)
+    if args.cache or args.offline:
+        configure_cache(args.cache or DEFAULT_CACHE, offline=args.offline)
+
+    if args.test is not None:
+        test_single_code(args.test)
+        return
+
+    if args.merge:
+        report = merge_results(args.merge, args.output)
+        logger.info("%s formations écrites dans %s, %s codes en double, %s conflits", report["formations"],
+                    args.output, len(report["duplicates"]), len(report["conflicts"]))
+        for code, by_path in report["conflicts"].items():
+            logger.warning("Conflit sur le code %s: %s", code, by_path)
+        build_index_file(args.output)
+        return
+
+    shard = parse_shard(args.shard) if args.shard else None
+
+    def requested_codes():
+        codes = parse_code_range(args.codes)
+        return shard_codes(codes, *shard) if shard else codes
+
+    if shard:
+        index, count = shard
+        args.journal = shard_path(args.journal, index, count)
+        args.output = shard_path(args.output, index, count)
+        args.catalog = shard_path(args.catalog, index, count)
+
+    # Les formations trouvées sont ajoutées au fil de l'eau, le JSON final en est tiré
+    hits_path = hits_path_for(args.output)
+    if args.compact:
+        count = compact_results(hits_path, args.output)
+        logger.info("%s formations écrites dans %s", count, args.output)
+        if not shard:
+            build_index_file(args.output)
         return
     
     start_time = time.time()
     
-    # Codes de formation à traiter
-    formation_codes = range(30001)
+    # Reprise : les codes déjà sondés avec succès ne sont pas refaits
+    journal = ScanJournal(args.journal)
+    records = journal.load()
+    total = sum(1 for _ in pending_codes(requested_codes(), records, args.retry_errors))
+    formation_codes = pending_codes(requested_codes(), records, args.retry_errors)
+    logger.info("%s codes à traiter (%s déjà dans le journal %s)", total, len(records), args.journal)
+
+    # Codes écartés par le sondage par blocs, comptés dans la progression
+    skipped = []
+    if args.blocks:
+        formation_codes = active_codes_only(formation_codes, args.blocks, journal, skipped)
+
+    hits = AppendLog(hits_path)
+    failed_codes = []
     
-    results = []
+    # La concurrence suit les latences et les erreurs d'ADE (voir AdaptiveConcurrency)
+    controller = AdaptiveConcurrency(initial=args.workers, maximum=max(args.workers, args.max_workers),
+                                     target_p95=args.target_latency, fixed=args.fixed)
+
+    scan_fetch = fetch_code
+    if args.two_phase:
+        windows = [tuple(window.split(":", 1)) for window in args.probe_window] if args.probe_window else None
+        scan_fetch = functools.partial(probe_then_fetch, windows=windows)
+
+    # Les calendriers déjà catalogués et inchangés ne sont pas réanalysés
+    catalog = CodeCatalog(args.catalog)
+    unchanged = 0
+
+    with open_pipeline(scan_fetch, controller, args.parse_workers, args.parse_queue, catalog.known) as pipeline:
+        # Une seule ligne de progression périodique, avec l'état de la concurrence et du pipeline
+        progress = ProgressReporter(total, args.progress_interval, details=[controller.summary, pipeline.summary])
+        for record in scan_records(pipeline, formation_codes, catalog):
+            journal.append(record)
+            unchanged += record.get("unchanged", False)
+            if record["status"] == HIT:
+                hits.append({"code": record["code"], "formation_names": record["formation_names"]})
+            elif record["status"] == ERROR:
+                failed_codes.append(record["code"])
+            progress.skipped = len(skipped)
+            progress.record(hit=record["status"] == HIT, error=record.get("error_type", "inconnue")
+                            if record["status"] == ERROR else None)
     
-    # Utilisation de ThreadPoolExecutor pour paralléliser les requêtes
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        # Soumettre les tâches
-        futures = [executor.submit(process_formation_code, code) for code in formation_codes]
-        
-        # Récupérer les résultats au fur et à mesure
-        for i, future in enumerate(futures):
-            try:
-                result = future.result()
-                if result:
-                    results.append(result)
-            except Exception as e:
-                print(f"Erreur lors du traitement du code {i}: {e}")
-            
-            # Affichage de la progression
-            if (i + 1) % 100 == 0:
-                elapsed_time = time.time() - start_time
-                print(f"Progression: {i + 1}/{len(formation_codes)} codes traités ({(i + 1) / len(formation_codes) * 100:.2f}%) - Temps écoulé: {elapsed_time:.2f}s")
-                
-                # Sauvegarde intermédiaire des résultats
-                save_results(results)
-    
-    # Sauvegarde finale des résultats
-    save_results(results)
+    journal.close()
+    hits.close()
+    catalog.close()
+    controller.maybe_log(force=True)
+    progress.maybe_report(force=True)
+
+    # Compaction finale des résultats dans le fichier JSON
+    count = compact_results(hits_path, args.output)
+    logger.info("Résultats sauvegardés dans %s (%s formations au total)", args.output, count)
+    # Index inversé (nom -> codes) ; celui d'un shard est construit après la fusion
+    if not shard:
+        build_index_file(args.output)
     
     elapsed_time = time.time() - start_time
-    print(f"Traitement terminé en {elapsed_time:.2f} secondes. {len(results)} formations trouvées.")
+    logger.info("Traitement terminé en %.2f secondes. %s formations trouvées.", elapsed_time, progress.hits)
+    if unchanged:
+        logger.info("%s calendriers inchangés depuis le scan précédent (catalogue %s)", unchanged, args.catalog)
+    if failed_codes:
+        logger.warning("%s codes en erreur, à relancer avec --retry-errors: %s", len(failed_codes), failed_codes)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,175 @@
+"""
+Index inversé des formations trouvées par le scan (`formations.json`).
+
+`formations.json` associe un code à ses noms de formation ; l'index répond
+à la question inverse sans parcourir tout le fichier :
+
+- nom de formation -> codes ;
+- mot du nom -> noms de formation ;
+- arbre de préfixes pour l'autocomplétion ("M2 M" -> "M2 MPRI", "M2 MO", ...).
+
+Les noms sont comparés sous leur forme canonique (`M2  MPRI` -> `M2 MPRI`).
+L'index est construit à la fin du scan et enregistré dans
+`formations_index.json` ; à la lecture, il est reconstruit si
+`formations.json` est plus récent.
+
+    python formation_index.py codes "M2 MPRI"
+    python formation_index.py prefix "M2 M"
+    python formation_index.py build
+"""
+import argparse
+import json
+import os
+import threading
+
+from ade_ics import normalize_formation_name
+from scan_journal import write_json_atomic
+
+DEFAULT_FORMATIONS = "formations.json"
+
+# Clé des nœuds de l'arbre de préfixes qui termine un nom
+END = "$"
+
+
+def build_index(formations):
+    """
+    Construit l'index à partir de `formations.json` chargé (code -> noms).
+
+    Returns:
+        dict: {"names": nom -> codes triés, "tokens": mot -> noms triés,
+               "trie": arbre de préfixes des noms}
+    """
+    names = {}
+    for code, formation_names in formations.items():
+        for name in formation_names:
+            names.setdefault(normalize_formation_name(name), set()).add(int(code))
+
+    tokens = {}
+    trie = {}
+    # Noms insérés dans l'ordre : les enfants de chaque nœud sont déjà triés
+    for name in sorted(names):
+        for token in name.split():
+            tokens.setdefault(token, set()).add(name)
+        node = trie
+        for char in name:
+            node = node.setdefault(char, {})
+        node[END] = name
+
+    return {
+        "names": {name: sorted(codes) for name, codes in sorted(names.items())},
+        "tokens": {token: sorted(token_names) for token, token_names in sorted(tokens.items())},
+        "trie": trie,
+    }
+
+
+def index_path_for(formations_path):
+    """Fichier d'index associé à un `formations.json` (`formations_index.json`)."""
+    return os.path.splitext(formations_path)[0] + "_index.json"
+
+
+def build_index_file(formations_path=DEFAULT_FORMATIONS, index_path=None):
+    """Construit et enregistre l'index d'un `formations.json`."""
+    with open(formations_path, 'r', encoding='utf-8') as f:
+        index = build_index(json.load(f))
+    write_json_atomic(index_path or index_path_for(formations_path), index)
+    return index
+
+
+class FormationIndex:
+    """Requêtes sur un index construit par `build_index`."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def codes_for(self, name):
+        """Codes dont la formation porte exactement ce nom."""
+        return self.index["names"].get(normalize_formation_name(name), [])
+
+    def names_with_token(self, token):
+        """Noms de formation qui contiennent ce mot (ex. "MPRI")."""
+        return self.index["tokens"].get(token.strip().upper(), [])
+
+    def search_prefix(self, prefix, limit=50):
+        """Noms de formation qui commencent par `prefix`, dans l'ordre alphabétique."""
+        node = self.index["trie"]
+        # Un espace final est significatif ("M2 " ne doit pas proposer "M20")
+        query = normalize_formation_name(prefix) + (" " if prefix.endswith(" ") and prefix.strip() else "")
+        for char in query:
+            node = node.get(char)
+            if node is None:
+                return []
+
+        found = []
+        stack = [node]
+        while stack and len(found) < limit:
+            node = stack.pop()
+            if END in node:
+                found.append(node[END])
+            # Parcours en profondeur dans l'ordre alphabétique
+            stack.extend(child for char, child in reversed(node.items()) if char != END)
+        return found
+
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def get_index(formations_path=DEFAULT_FORMATIONS, index_path=None):
+    """
+    Charge l'index à la première demande et le garde en mémoire.
+
+    L'index enregistré est utilisé s'il est plus récent que `formations.json`,
+    sinon il est reconstruit (et réenregistré). Le cache mémoire est
+    invalidé quand `formations.json` change.
+    """
+    index_path = index_path or index_path_for(formations_path)
+    mtime = os.path.getmtime(formations_path)
+    with _lock:
+        cached = _loaded.get(formations_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= mtime:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        else:
+            index = build_index_file(formations_path, index_path)
+
+        loaded = FormationIndex(index)
+        _loaded[formations_path] = (mtime, loaded)
+        return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recherche dans l'index des formations ADE.")
+    parser.add_argument("--formations", default=DEFAULT_FORMATIONS, help="Fichier formations.json")
+    parser.add_argument("--index", help="Fichier de l'index (par défaut formations_index.json)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="Reconstruit l'index")
+    codes_parser = subparsers.add_parser("codes", help="Codes d'une formation")
+    codes_parser.add_argument("name")
+    prefix_parser = subparsers.add_parser("prefix", help="Formations qui commencent par un préfixe")
+    prefix_parser.add_argument("prefix")
+    prefix_parser.add_argument("--limit", type=int, default=50)
+    token_parser = subparsers.add_parser("token", help="Formations qui contiennent un mot")
+    token_parser.add_argument("token")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = build_index_file(args.formations, args.index)
+        print(f"Index de {len(index['names'])} formations enregistré dans "
+              f"{args.index or index_path_for(args.formations)}")
+        return
+
+    index = get_index(args.formations, args.index)
+    if args.command == "codes":
+        result = index.codes_for(args.name)
+    elif args.command == "prefix":
+        result = {name: index.codes_for(name) for name in index.search_prefix(args.prefix, args.limit)}
+    else:
+        result = {name: index.codes_for(name) for name in index.names_with_token(args.token)}
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
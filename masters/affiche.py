@@ -1,10 +1,14 @@
-import icalendar
 import datetime
 import pytz
 import os
+import sys
 from dateutil.rrule import rrulestr
 from dateutil.tz import tzlocal
 
+# Les modules communs (calendar_events...) sont à la racine du dépôt
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from calendar_events import iter_events
+
 def sauvegarder_calendrier(chemin_fichier_ics, chemin_fichier_txt=None):
     """
     Lit un fichier ICS, affiche les événements du calendrier et les sauvegarde dans un fichier TXT.
@@ -24,33 +28,9 @@ def sauvegarder_calendrier(chemin_fichier_ics, chemin_fichier_txt=None):
         chemin_fichier_txt = f"{base_nom}.txt"
     
     try:
-        # Lecture du fichier ICS
-        with open(chemin_fichier_ics, 'rb') as fichier:
-            cal = icalendar.Calendar.from_ical(fichier.read())
-        
-        # Tri des événements par date
-        evenements = []
-        for composant in cal.walk():
-            if composant.name == "VEVENT":
-                debut = composant.get('dtstart')
-                if debut:
-                    debut_dt = debut.dt
-                    # Convertir en datetime si c'est une date
-                    if isinstance(debut_dt, datetime.date) and not isinstance(debut_dt, datetime.datetime):
-                        debut_dt = datetime.datetime.combine(debut_dt, datetime.time.min)
-                    
-                    # Ajouter l'événement à la liste
-                    evenements.append({
-                        'debut': debut_dt,
-                        'fin': composant.get('dtend').dt if composant.get('dtend') else None,
-                        'resume': str(composant.get('summary', 'Sans titre')),
-                        'description': str(composant.get('description', '')),
-                        'lieu': str(composant.get('location', '')),
-                        'recurrent': True if composant.get('rrule') else False
-                    })
-        
-        # Trier les événements par date de début
-        evenements.sort(key=lambda x: x['debut'])
+        # Lecture du fichier ICS (horaires en heure de Paris, voir calendar_events)
+        # et tri des événements par date de début
+        evenements = sorted(iter_events(chemin_fichier_ics), key=lambda evenement: evenement.start)
         
         # Préparer le contenu à sauvegarder
         contenu = []
@@ -65,7 +45,7 @@ def sauvegarder_calendrier(chemin_fichier_ics, chemin_fichier_txt=None):
         jour_courant = None
         
         for evt in evenements:
-            jour = evt['debut'].date()
+            jour = evt.start.date()
             
             # Ajouter l'en-tête du jour si on change de jour
             if jour_courant != jour:
@@ -74,20 +54,20 @@ def sauvegarder_calendrier(chemin_fichier_ics, chemin_fichier_txt=None):
                 contenu.append("-" * 30)
             
             # Ajouter l'heure de début et de fin
-            heure_debut = evt['debut'].strftime('%H:%M')
-            heure_fin = evt['fin'].strftime('%H:%M') if evt['fin'] else "??:??"
+            heure_debut = evt.start.strftime('%H:%M')
+            heure_fin = evt.end.strftime('%H:%M') if evt.end else "??:??"
             
-            contenu.append(f"{heure_debut} - {heure_fin} : {evt['resume']}")
+            contenu.append(f"{heure_debut} - {heure_fin} : {evt.title}")
             
-            if evt['recurrent']:
+            if evt.recurrent:
                 contenu.append("  Note: Événement récurrent")
                 
-            if evt['lieu'] and evt['lieu'] != 'None':
-                contenu.append(f"  Lieu: {evt['lieu']}")
+            if evt.location and evt.location != 'None':
+                contenu.append(f"  Lieu: {evt.location}")
             
-            if evt['description'] and evt['description'] != 'None':
+            if evt.description and evt.description != 'None':
                 # Limiter la description pour la lisibilité
-                desc_lignes = evt['description'].split('\n')
+                desc_lignes = evt.description.split('\n')
                 desc_formatee = "\n    ".join([ligne[:80] + ("..." if len(ligne) > 80 else "") for ligne in desc_lignes[:3]])
                 contenu.append(f"  Description: {desc_formatee}")
                 
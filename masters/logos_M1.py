@@ -1,12 +1,17 @@
 from icalendar import Calendar, Event
 import os
+import sys
 import json
+import logging
 from datetime import datetime
 
-def read_calendar(file_path):
-    """Lit un fichier ICS et retourne un objet Calendar."""
-    with open(file_path, 'rb') as f:
-        return Calendar.from_ical(f.read())
+# Les modules communs (ade_logging...) sont à la racine du dépôt
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ade_logging import setup_logging
+from ade_parser import event_component
+from calendar_events import iter_entries
+
+logger = logging.getLogger(__name__)
 
 def save_calendar(calendar, file_path):
     """Sauvegarde un objet Calendar dans un fichier ICS."""
@@ -23,51 +28,47 @@ def backup_custom_events(calendar_path, custom_events_json):
         custom_events_json: Chemin vers le fichier JSON où sauvegarder les événements
     """
     if not os.path.exists(calendar_path):
-        print(f"Calendrier non trouvé: {calendar_path}")
+        logger.warning("Calendrier non trouvé: %s", calendar_path)
         return []
     
     try:
-        # Lire le calendrier
-        cal = read_calendar(calendar_path)
-        
-        # Extraire les événements personnalisés
+        # Extraire les événements personnalisés ; seuls ceux-ci sont construits par icalendar
         custom_events = []
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                uid = str(component.get('uid', ''))
-                if uid.startswith('custom_'):
-                    # Convertir l'événement en dictionnaire pour le JSON
-                    event_dict = {}
-                    for key, value in component.items():
-                        if key == 'dtstart' or key == 'dtend':
-                            # Stocker la date au format ISO
-                            event_dict[key] = value.dt.isoformat()
-                        else:
-                            # Stocker les autres valeurs en texte
-                            event_dict[key] = str(value)
-                    
-                    # Stocker les props supplémentaires
-                    if 'for_m1' in component:
-                        event_dict['for_m1'] = bool(component['for_m1'])
+        for event, lines in iter_entries(calendar_path):
+            if event.uid.startswith('custom_'):
+                component = event_component(lines)
+                # Convertir l'événement en dictionnaire pour le JSON
+                event_dict = {}
+                for key, value in component.items():
+                    if key == 'dtstart' or key == 'dtend':
+                        # Stocker la date au format ISO
+                        event_dict[key] = value.dt.isoformat()
                     else:
-                        event_dict['for_m1'] = True
-                        
-                    if 'for_m2' in component:
-                        event_dict['for_m2'] = bool(component['for_m2'])
-                    else:
-                        event_dict['for_m2'] = True
+                        # Stocker les autres valeurs en texte
+                        event_dict[key] = str(value)
+                
+                # Stocker les props supplémentaires
+                if 'for_m1' in component:
+                    event_dict['for_m1'] = bool(component['for_m1'])
+                else:
+                    event_dict['for_m1'] = True
                     
-                    custom_events.append(event_dict)
+                if 'for_m2' in component:
+                    event_dict['for_m2'] = bool(component['for_m2'])
+                else:
+                    event_dict['for_m2'] = True
+                
+                custom_events.append(event_dict)
         
         # Sauvegarder dans le fichier JSON
         with open(custom_events_json, 'w', encoding='utf-8') as f:
             json.dump(custom_events, f, ensure_ascii=False, indent=4)
             
-        print(f"Sauvegarde de {len(custom_events)} événements personnalisés dans {custom_events_json}")
+        logger.info("Sauvegarde de %s événements personnalisés dans %s", len(custom_events), custom_events_json)
         return custom_events
     
     except Exception as e:
-        print(f"Erreur lors de la sauvegarde des événements personnalisés: {e}")
+        logger.error("Erreur lors de la sauvegarde des événements personnalisés: %s", e)
         return []
 
 def restore_custom_events(calendar, custom_events_json):
@@ -79,7 +80,7 @@ def restore_custom_events(calendar, custom_events_json):
         custom_events_json: Chemin vers le fichier JSON contenant les événements
     """
     if not os.path.exists(custom_events_json):
-        print(f"Fichier d'événements personnalisés non trouvé: {custom_events_json}")
+        logger.warning("Fichier d'événements personnalisés non trouvé: %s", custom_events_json)
         return calendar
     
     try:
@@ -109,11 +110,11 @@ def restore_custom_events(calendar, custom_events_json):
             # Ajouter l'événement au calendrier
             calendar.add_component(event)
         
-        print(f"Restauration de {len(custom_events)} événements personnalisés")
+        logger.info("Restauration de %s événements personnalisés", len(custom_events))
         return calendar
     
     except Exception as e:
-        print(f"Erreur lors de la restauration des événements personnalisés: {e}")
+        logger.error("Erreur lors de la restauration des événements personnalisés: %s", e)
         return calendar
 
 def create_custom_calendar(source_files, course_filters, output_file):
@@ -149,29 +150,28 @@ def create_custom_calendar(source_files, course_filters, output_file):
         if file_name not in course_filters:
             continue
         
-        # Lire le calendrier source
-        cal = read_calendar(source_file)
-        
-        # Pour chaque événement dans le calendrier
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                # Vérifier si l'événement correspond à l'un de nos filtres
-                summary = str(component.get('summary', ''))
-                
-                # Si le résumé contient l'un des mots-clés pour ce fichier
-                if any(keyword.lower() in summary.lower() for keyword in course_filters[file_name]):
-                    # Ajouter l'événement à notre calendrier personnalisé
-                    custom_cal.add_component(component)
+        # Lire le calendrier source événement par événement ; seuls les
+        # événements retenus sont construits par icalendar
+        for event, lines in iter_entries(source_file):
+            # Vérifier si l'événement correspond à l'un de nos filtres
+            summary = event.title
+            
+            # Si le résumé contient l'un des mots-clés pour ce fichier
+            if any(keyword.lower() in summary.lower() for keyword in course_filters[file_name]):
+                # Ajouter l'événement à notre calendrier personnalisé
+                custom_cal.add_component(event_component(lines))
     
     # Restaurer les événements personnalisés
     custom_cal = restore_custom_events(custom_cal, custom_events_json)
     
     # Sauvegarder le calendrier personnalisé
     save_calendar(custom_cal, output_file)
-    print(f"Calendrier personnalisé créé avec succès : {output_file}")
+    logger.info("Calendrier personnalisé créé avec succès : %s", output_file)
 
 # Exemple d'utilisation
 if __name__ == "__main__":
+    setup_logging("INFO")
+    
     # Liste des fichiers sources
     source_files = [
         "M1_MFA.ics",
@@ -0,0 +1,336 @@
+"""
+Rescans planifiés des codes de formation ADE.
+
+Les nouvelles formations apparaissent le plus souvent à côté de codes déjà
+connus. Chaque passage (typiquement une fois par nuit) dépense un budget
+fixe de requêtes, dans cet ordre :
+
+1. les codes déjà présents dans `formations.json`, récupérés en entier,
+   à tour de rôle d'un passage à l'autre s'ils ne tiennent pas tous dans
+   le budget ;
+2. leur voisinage (à au plus `radius` codes), les plus proches d'abord,
+   sondés à moindre coût (`probe_then_fetch`), lui aussi à tour de rôle ;
+3. un balayage lent de tout l'espace des codes, qui reprend là où le
+   passage précédent s'était arrêté (curseurs dans `rescan_state.json`).
+
+Une part du budget (`--sweep-share`) est réservée au balayage, pour qu'il
+avance à chaque passage même quand les deux premières étapes suffiraient à
+épuiser le budget ; les requêtes qu'elles n'utilisent pas lui reviennent.
+
+Un code sondé compte dans le budget pour ses requêtes de sondage et pour la
+récupération complète qui suit un sondage positif.
+
+Le bilan liste les codes apparus, disparus et ceux dont les noms de
+formation ont changé ; `formations.json` et son index sont mis à jour.
+
+    python rescan_scheduler.py [--budget 3000] [--radius 16] [--sweep-share 0.25] [--codes 0-30000] [--dry-run]
+"""
+import argparse
+import bisect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from ade_client import PROBE_WINDOWS, configure_cache
+from ade_governor import configure as configure_governor
+from adaptive_concurrency import AdaptiveConcurrency
+from ade_logging import ProgressReporter, add_logging_arguments, setup_logging_from_args
+from extract_formation_names import fetch_code, probe_then_fetch, open_pipeline, scan_records
+from formation_index import build_index_file, DEFAULT_FORMATIONS
+from scan_catalog import CodeCatalog, DEFAULT_CATALOG
+from scan_journal import AppendLog, hits_path_for, write_json_atomic, HIT, MISS, ERROR
+
+DEFAULT_STATE = "rescan_state.json"
+DEFAULT_BUDGET = 3000
+DEFAULT_RADIUS = 16
+DEFAULT_SWEEP_SHARE = 0.25
+
+logger = logging.getLogger(__name__)
+
+
+def neighbourhood(hits, radius, low, high):
+    """
+    Codes à au plus `radius` d'un hit, hors hits, les plus proches d'abord.
+
+    Returns:
+        iterator: Codes voisins, chacun une seule fois
+    """
+    hits = set(hits)
+    ordered = sorted(hits)
+    seen = set()
+    for distance in range(1, radius + 1):
+        for code in ordered:
+            for neighbour in (code - distance, code + distance):
+                if low <= neighbour <= high and neighbour not in hits and neighbour not in seen:
+                    seen.add(neighbour)
+                    yield neighbour
+
+
+class RequestBudget:
+    """
+    Requêtes encore disponibles pendant un passage, partagées entre threads.
+
+    Args:
+        total (int): Budget du passage
+    """
+
+    def __init__(self, total):
+        self.remaining = total
+        self.lock = threading.Lock()
+
+    def reserve(self, count, keep=0):
+        """
+        Réserve `count` requêtes en en laissant au moins `keep` disponibles ;
+        retourne False (sans rien réserver) si le budget ne suffit pas.
+        """
+        with self.lock:
+            if self.remaining - count < keep:
+                return False
+            self.remaining -= count
+            return True
+
+    def refund(self, count):
+        """Rend des requêtes réservées mais non envoyées."""
+        with self.lock:
+            self.remaining += count
+
+
+def plan_rescan(hits, budget, radius=DEFAULT_RADIUS, low=0, high=30000, cursor=None, known_cursor=None,
+                neighbour_cursor=None):
+    """
+    Ordre de passage des codes : hits connus, voisinage puis balayage.
+
+    Les hits connus sont pris à tour de rôle à partir de `known_cursor`
+    (au plus `budget` par passage), pour que tous soient revérifiés d'un
+    passage à l'autre ; le voisinage (les plus proches d'abord) est de même
+    repris à la position `neighbour_cursor` et le balayage à `cursor`.
+
+    Returns:
+        dict: "known" (hits du passage, dans l'ordre), "neighbours" (leur
+              voisinage à partir de `neighbour_cursor`), "neighbour_start"
+              (position du premier voisin dans le voisinage complet) et
+              "sweep" (tout l'espace des codes à partir de `cursor`, sans
+              les deux listes précédentes)
+    """
+    ordered = sorted(code for code in hits if low <= code <= high)
+    first = bisect.bisect_left(ordered, known_cursor) if known_cursor is not None else 0
+    known = (ordered[first:] + ordered[:first])[:budget]
+    neighbours = list(neighbourhood(known, radius, low, high))
+    neighbour_start = neighbour_cursor % len(neighbours) if neighbour_cursor and neighbours else 0
+    neighbours = neighbours[neighbour_start:] + neighbours[:neighbour_start]
+
+    planned = set(known) | set(neighbours)
+    start = cursor if cursor is not None and low <= cursor <= high else low
+    sweep = [code for code in itertools.chain(range(start, high + 1), range(low, start)) if code not in planned]
+    return {"known": known, "neighbours": neighbours, "neighbour_start": neighbour_start, "sweep": sweep}
+
+
+def schedule(plan, budget, probe_cost, low=0, high=30000, cursors=None, sweep_reserve=0):
+    """
+    Codes d'un plan (voir `plan_rescan`), tant que le budget le permet.
+
+    Un hit connu réserve une requête (calendrier complet) ; un autre code
+    réserve `probe_cost` requêtes de sondage plus la récupération complète
+    qui suit un sondage positif. Les hits connus et le voisinage laissent
+    `sweep_reserve` requêtes au balayage ; chaque étape s'arrête au premier
+    code que sa part du budget ne couvre plus.
+
+    Args:
+        budget (RequestBudget): Budget du passage
+        cursors (dict): Mis à jour au fil des codes rendus : "known_cursor",
+                        "neighbour_cursor", "cursor" (reprise au prochain
+                        passage) et "wrapped" (le balayage a fait le tour de
+                        l'espace des codes)
+        sweep_reserve (int): Requêtes réservées au balayage
+
+    Yields:
+        int: Codes à traiter, dans l'ordre du plan
+    """
+    cursors = {} if cursors is None else cursors
+    for code in plan["known"]:
+        if not budget.reserve(1, keep=sweep_reserve):
+            break
+        cursors["known_cursor"] = code + 1
+        yield code
+    for position, code in enumerate(plan["neighbours"], plan["neighbour_start"] + 1):
+        if not budget.reserve(probe_cost + 1, keep=sweep_reserve):
+            break
+        cursors["neighbour_cursor"] = position % len(plan["neighbours"])
+        yield code
+    previous = None
+    for code in plan["sweep"]:
+        if not budget.reserve(probe_cost + 1):
+            return
+        cursors["cursor"] = code + 1 if code < high else low
+        # Le balayage repasse de `high` à `low`
+        if code == high or (previous is not None and code < previous):
+            cursors["wrapped"] = True
+        previous = code
+        yield code
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_rescan(formations_path=DEFAULT_FORMATIONS, state_path=DEFAULT_STATE, catalog_path=DEFAULT_CATALOG,
+               budget=DEFAULT_BUDGET, radius=DEFAULT_RADIUS, low=0, high=30000, windows=None,
+               workers=10, max_workers=64, dry_run=False, sweep_share=DEFAULT_SWEEP_SHARE):
+    """
+    Effectue un passage planifié par `plan_rescan` et met à jour
+    `formations.json`, son index et le fichier d'état.
+
+    Un code connu n'est déclaré disparu que si ADE a renvoyé un calendrier
+    valide sans la formation ; un code en erreur (réseau, statut d'erreur,
+    page de maintenance au lieu d'un calendrier) est gardé.
+
+    Returns:
+        dict: Bilan du passage, sérialisable en JSON
+    """
+    started = time.time()
+    with open(formations_path, 'r', encoding='utf-8') as f:
+        formations = {int(code): names for code, names in json.load(f).items()}
+    state = load_state(state_path)
+    plan = plan_rescan(formations, budget, radius, low, high, state.get("cursor"), state.get("known_cursor"),
+                       state.get("neighbour_cursor"))
+    probe_cost = len(windows or PROBE_WINDOWS)
+    sweep_reserve = int(budget * sweep_share)
+
+    # Plan au pire (chaque sondage suivi d'une récupération complète) ; en
+    # cours de passage, les requêtes non utilisées sont rendues au budget
+    cursors = {"known_cursor": state.get("known_cursor"), "neighbour_cursor": state.get("neighbour_cursor"),
+               "cursor": state.get("cursor"), "wrapped": False}
+    planned = list(schedule(plan, RequestBudget(budget), probe_cost, low, high, dict(cursors), sweep_reserve))
+    known = set(plan["known"])
+    neighbours = set(plan["neighbours"])
+    report = {
+        "started_at": started,
+        "planned": {"known": sum(code in known for code in planned),
+                    "neighbours": sum(code in neighbours for code in planned),
+                    "sweep": sum(code not in known and code not in neighbours for code in planned)},
+    }
+    if dry_run:
+        return report
+
+    def fetch(code):
+        if code in known:
+            return fetch_code(code)
+        return probe_then_fetch(code, windows)
+
+    catalog = CodeCatalog(catalog_path)
+    controller = AdaptiveConcurrency(initial=workers, maximum=max(workers, max_workers))
+    new, disappeared, changed, errors = {}, {}, {}, []
+    requests_left = RequestBudget(budget)
+    codes = schedule(plan, requests_left, probe_cost, low, high, cursors, sweep_reserve)
+    with open_pipeline(fetch, controller, known=catalog.known) as pipeline:
+        progress = ProgressReporter(len(planned), details=[controller.summary, pipeline.summary])
+        for record in scan_records(pipeline, codes, catalog):
+            code = record["code"]
+            if record.get("probe"):
+                # Sondage négatif : la récupération complète réservée n'a pas eu lieu
+                requests_left.refund(1)
+            progress.record(hit=record["status"] == HIT, error=record.get("error_type", "inconnue")
+                            if record["status"] == ERROR else None)
+            if record["status"] == ERROR:
+                errors.append(code)
+            elif record["status"] == HIT and code not in formations:
+                new[code] = record["formation_names"]
+            elif record["status"] == HIT and sorted(record["formation_names"]) != sorted(formations[code]):
+                changed[code] = {"before": formations[code], "after": record["formation_names"]}
+            elif record["status"] == MISS and code in formations:
+                disappeared[code] = formations[code]
+    catalog.close()
+    progress.maybe_report(force=True)
+
+    if new or changed or disappeared:
+        for code, names in new.items():
+            formations[code] = names
+        for code, change in changed.items():
+            formations[code] = change["after"]
+        for code in disappeared:
+            del formations[code]
+        write_json_atomic(formations_path, {str(code): formations[code] for code in sorted(formations)})
+        build_index_file(formations_path)
+
+        # Le fichier JSONL des formations trouvées reste cohérent avec le JSON
+        # (une liste vide retire le code à la prochaine compaction)
+        hits_path = hits_path_for(formations_path)
+        if os.path.exists(hits_path):
+            hits = AppendLog(hits_path)
+            for code, names in new.items():
+                hits.append({"code": code, "formation_names": names})
+            for code, change in changed.items():
+                hits.append({"code": code, "formation_names": change["after"]})
+            for code in disappeared:
+                hits.append({"code": code, "formation_names": []})
+            hits.close()
+
+    write_json_atomic(state_path, {
+        "cursor": cursors["cursor"],
+        "known_cursor": cursors["known_cursor"],
+        "neighbour_cursor": cursors["neighbour_cursor"],
+        "last_run": started,
+        "sweeps_completed": state.get("sweeps_completed", 0) + cursors["wrapped"],
+    })
+
+    report.update({
+        "cursor": cursors["cursor"],
+        "requests_left": requests_left.remaining,
+        "duration": round(time.time() - started, 3),
+        "new": {str(code): names for code, names in sorted(new.items())},
+        "disappeared": {str(code): names for code, names in sorted(disappeared.items())},
+        "changed": {str(code): change for code, change in sorted(changed.items())},
+        "errors": sorted(errors),
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescan planifié des codes de formation ADE.")
+    parser.add_argument("--formations", default=DEFAULT_FORMATIONS, help="Fichier formations.json à tenir à jour")
+    parser.add_argument("--state", default=DEFAULT_STATE, help="Fichier d'état (curseur du balayage)")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG, help="Catalogue SQLite des calendriers")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="Nombre de requêtes du passage")
+    parser.add_argument("--radius", type=int, default=DEFAULT_RADIUS, help="Taille du voisinage des codes connus")
+    parser.add_argument("--sweep-share", type=float, default=DEFAULT_SWEEP_SHARE,
+                        help="Part du budget réservée au balayage de tout l'espace des codes")
+    parser.add_argument("--codes", default="0-30000", help="Espace des codes balayé (ex. 0-30000)")
+    parser.add_argument("--probe-window", action="append", metavar="DEBUT:FIN",
+                        help="Fenêtre de sondage des codes inconnus (répétable, dates YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=10, help="Nombre de requêtes simultanées au départ")
+    parser.add_argument("--max-workers", type=int, default=64, help="Nombre maximal de requêtes simultanées")
+    parser.add_argument("--rate", type=float, default=20.0, help="Débit maximal vers ADE, en requêtes par seconde")
+    parser.add_argument("--cache", help="Cache local des réponses ADE (fichier SQLite)")
+    parser.add_argument("--report", help="Fichier où écrire le bilan JSON (sinon sur la sortie standard)")
+    parser.add_argument("--dry-run", action="store_true", help="Affiche seulement le plan du passage")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+
+    setup_logging_from_args(args)
+    configure_governor(rate=args.rate)
+    if args.cache:
+        configure_cache(args.cache)
+    low, high = (int(part) for part in args.codes.split("-", 1))
+    windows = [tuple(window.split(":", 1)) for window in args.probe_window] if args.probe_window else None
+
+    report = run_rescan(args.formations, args.state, args.catalog, args.budget, args.radius, low, high,
+                        windows, args.workers, args.max_workers, args.dry_run, args.sweep_share)
+
+    if not args.dry_run:
+        logger.info("%s nouveaux codes, %s disparus, %s modifiés, %s en erreur", len(report["new"]),
+                    len(report["disappeared"]), len(report["changed"]), len(report["errors"]))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Catalogue (SQLite) des calendriers rencontrés par le scan.
+
+Pour chaque code dont ADE a renvoyé un calendrier, le scanner enregistre le
+nombre d'événements, les dates du premier et du dernier cours, la taille de
+la réponse, son empreinte normalisée et la latence du téléchargement. Le
+catalogue permet ensuite :
+
+- de ne pas réanalyser un calendrier dont l'empreinte n'a pas changé ;
+- de traiter en priorité les formations les plus chargées ;
+- de repérer les codes qui renvoient exactement le même calendrier.
+
+    python scan_catalog.py [--catalog scan_catalog.sqlite] [--duplicates] [--top 20]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CATALOG = "scan_catalog.sqlite"
+
+COLUMNS = ("code", "status", "formation_names", "events", "first_date", "last_date",
+           "size", "hash", "latency", "scanned_at", "changed_at")
+
+
+class CodeCatalog:
+    """
+    Métadonnées par code, utilisables depuis plusieurs threads.
+
+    Args:
+        path (str): Fichier SQLite du catalogue
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS codes (
+                code INTEGER PRIMARY KEY, status TEXT, formation_names TEXT,
+                events INTEGER, first_date TEXT, last_date TEXT, size INTEGER,
+                hash TEXT, latency REAL, scanned_at REAL, changed_at REAL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS codes_hash ON codes (hash)")
+        self.db.commit()
+
+    def record(self, record):
+        """
+        Enregistre un enregistrement du scan qui porte un calendrier (clé
+        "hash"). Pour un calendrier inchangé (clé "unchanged"), seules la date
+        du scan et la latence sont mises à jour.
+        """
+        now = time.time()
+        with self.lock:
+            if record.get("unchanged"):
+                self.db.execute("UPDATE codes SET scanned_at = ?, latency = ? WHERE code = ?",
+                                (now, record.get("latency"), record["code"]))
+            else:
+                names = record.get("formation_names")
+                self.db.execute(
+                    "INSERT OR REPLACE INTO codes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (record["code"], record["status"], json.dumps(names, ensure_ascii=False) if names else None,
+                     record.get("events"), record.get("first_date"), record.get("last_date"),
+                     record.get("size"), record["hash"], record.get("latency"), now, now)
+                )
+            self.db.commit()
+
+    def known(self, code):
+        """
+        Calendrier déjà catalogué d'un code, pour reconnaître s'il n'a pas
+        changé ; lu à la demande, sans charger tout le catalogue.
+
+        Returns:
+            dict: {"hash", "status", "formation_names"}, ou None si le code n'est pas catalogué
+        """
+        with self.lock:
+            row = self.db.execute("SELECT hash, status, formation_names FROM codes WHERE code = ?",
+                                  (code,)).fetchone()
+        if row is None:
+            return None
+        hash_, status, names = row
+        return {"hash": hash_, "status": status, "formation_names": json.loads(names) if names else None}
+
+    def get(self, code):
+        """Métadonnées d'un code, ou None."""
+        with self.lock:
+            row = self.db.execute("SELECT * FROM codes WHERE code = ?", (code,)).fetchone()
+        return self._entry(row) if row else None
+
+    def duplicates(self):
+        """
+        Groupes de codes qui renvoient exactement le même calendrier (même
+        empreinte normalisée), calendriers vides exclus.
+
+        Returns:
+            list: Listes de codes triées, une par empreinte partagée
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT GROUP_CONCAT(code) FROM codes WHERE events > 0 "
+                "GROUP BY hash HAVING COUNT(*) > 1 ORDER BY MIN(code)"
+            ).fetchall()
+        return [sorted(int(code) for code in row[0].split(",")) for row in rows]
+
+    def by_priority(self, limit=None):
+        """Codes triés du plus chargé au moins chargé, puis par dernier cours."""
+        query = "SELECT * FROM codes WHERE events > 0 ORDER BY events DESC, last_date DESC"
+        with self.lock:
+            rows = self.db.execute(query + (" LIMIT ?" if limit else ""), (limit,) if limit else ()).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def stats(self):
+        """Nombre de codes catalogués, dont HIT, et taille totale des réponses."""
+        with self.lock:
+            count, hits, size = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(status = 'hit'), 0), COALESCE(SUM(size), 0) FROM codes"
+            ).fetchone()
+        return {"codes": count, "hits": hits, "bytes": size}
+
+    @staticmethod
+    def _entry(row):
+        entry = dict(zip(COLUMNS, row))
+        if entry["formation_names"]:
+            entry["formation_names"] = json.loads(entry["formation_names"])
+        return entry
+
+    def close(self):
+        self.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultation du catalogue des calendriers scannés.")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG, help="Fichier SQLite du catalogue")
+    parser.add_argument("--duplicates", action="store_true", help="Liste les codes au calendrier identique")
+    parser.add_argument("--top", type=int, metavar="N", help="Affiche les N codes les plus chargés")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.catalog):
+        print(f"Catalogue non trouvé: {args.catalog}")
+        return
+
+    catalog = CodeCatalog(args.catalog)
+    stats = catalog.stats()
+    print(f"{stats['codes']} codes catalogués, dont {stats['hits']} formations "
+          f"({stats['bytes'] / 1024 / 1024:.1f} Mo de calendriers)")
+    if args.duplicates:
+        for group in catalog.duplicates():
+            print(f"Calendrier identique: {group}")
+    if args.top:
+        for entry in catalog.by_priority(args.top):
+            print(f"Code {entry['code']}: {entry['events']} événements "
+                  f"du {entry['first_date']} au {entry['last_date']} - {entry['formation_names']}")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Journal de reprise du scan des codes de formation.
+
+Chaque code sondé ajoute une ligne JSON au journal (ajout seul, jamais de
+réécriture) : son statut (hit, miss ou error), l'empreinte du calendrier
+reçu et, pour un hit, les noms de formation. Un scan interrompu reprend là
+où il s'était arrêté en relisant le journal ; la dernière ligne d'un code
+fait foi.
+
+Les formations trouvées sont de même ajoutées une par une à un fichier
+JSONL (`formations.jsonl`) ; `compact_results` les reporte dans le
+`formations.json` existant par écriture atomique.
+"""
+import json
+import os
+
+HIT = "hit"
+MISS = "miss"
+ERROR = "error"
+
+DEFAULT_JOURNAL = "scan_journal.jsonl"
+
+
+class AppendLog:
+    """
+    Fichier JSONL en ajout seul.
+
+    Chaque enregistrement est écrit et vidé tout de suite (un lecteur le voit
+    pendant le scan) ; la synchronisation sur disque (`fsync`) est faite par
+    lots de `fsync_every` enregistrements, et à la fermeture.
+
+    Args:
+        path (str): Fichier JSONL
+        fsync_every (int): Nombre d'enregistrements entre deux `fsync`
+    """
+
+    def __init__(self, path, fsync_every=100):
+        self.path = path
+        self.fsync_every = fsync_every
+        self._file = None
+        self._unsynced = 0
+
+    def append(self, record):
+        """Ajoute un enregistrement à la fin du fichier."""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        """Force l'écriture sur disque des enregistrements ajoutés."""
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+
+def iter_records(path):
+    """Relit un fichier JSONL en ignorant une éventuelle dernière ligne tronquée."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Dernière ligne tronquée par un arrêt brutal
+                continue
+
+
+class ScanJournal(AppendLog):
+    """
+    Journal de reprise, une ligne JSON par code sondé.
+
+    Args:
+        path (str): Fichier JSONL du journal
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL, fsync_every=100):
+        super().__init__(path, fsync_every)
+
+    def load(self):
+        """
+        Relit le journal.
+
+        Returns:
+            JournalStatus: Dernier statut de chaque code du journal
+        """
+        statuses = JournalStatus()
+        for record in iter_records(self.path):
+            statuses.set(record["code"], record["status"])
+        return statuses
+
+
+class JournalStatus:
+    """
+    Dernier statut (HIT, MISS ou ERROR) de chaque code relu dans le journal,
+    rangé sur un octet par code : la mémoire dépend du plus grand code, pas
+    du nombre de lignes du journal.
+    """
+
+    _STATUSES = (None, HIT, MISS, ERROR)
+    _VALUES = {HIT: 1, MISS: 2, ERROR: 3}
+
+    def __init__(self):
+        self._table = bytearray()
+        self._count = 0
+
+    def set(self, code, status):
+        code = int(code)
+        if code >= len(self._table):
+            self._table.extend(bytes(max(code + 1, 2 * len(self._table)) - len(self._table)))
+        if not self._table[code]:
+            self._count += 1
+        self._table[code] = self._VALUES[status]
+
+    def get(self, code):
+        """Statut du code, None s'il n'est pas dans le journal."""
+        return self._STATUSES[self._table[code]] if 0 <= code < len(self._table) else None
+
+    def __len__(self):
+        return self._count
+
+
+def hits_path_for(output):
+    """Fichier JSONL des formations trouvées associé à un `formations.json`."""
+    return os.path.splitext(output)[0] + ".jsonl"
+
+
+def write_json_atomic(path, data):
+    """Écrit un fichier JSON dans un fichier temporaire puis le renomme à sa place."""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def compact_results(hits_path, output):
+    """
+    Met à jour `output` (code -> noms de formation, trié par code) avec le
+    fichier JSONL des formations trouvées : le contenu actuel d'`output` est
+    repris, puis chaque ligne du JSONL l'emporte sur lui. La dernière ligne
+    d'un code fait foi (une liste de noms vide retire le code, voir
+    `rescan_scheduler`) ; l'écriture est atomique, le fichier peut être lu
+    pendant un scan. Sans fichier JSONL, `output` n'est pas réécrit.
+
+    Returns:
+        int: Nombre de formations dans `output`
+    """
+    formations = {}
+    if os.path.exists(output):
+        with open(output, 'r', encoding='utf-8') as f:
+            formations = {int(code): names for code, names in json.load(f).items()}
+    if not os.path.exists(hits_path):
+        return len(formations)
+
+    for record in iter_records(hits_path):
+        if record["formation_names"]:
+            formations[int(record["code"])] = record["formation_names"]
+        else:
+            formations.pop(int(record["code"]), None)
+    write_json_atomic(output, {str(code): formations[code] for code in sorted(formations)})
+    return len(formations)
+
+
+def merge_results(paths, output):
+    """
+    Fusionne les résultats de plusieurs shards dans un seul `formations.json`.
+
+    Chaque entrée peut être un `formations.json` ou un fichier JSONL de
+    formations trouvées. Les fichiers sont lus dans l'ordre alphabétique et
+    les noms de chaque code triés, pour que la fusion soit déterministe. Un
+    code présent dans plusieurs fichiers est un doublon ; s'il n'y a pas les
+    mêmes noms partout, c'est un conflit, résolu par l'union des noms.
+
+    Returns:
+        dict: Bilan de la fusion : nombre de formations, doublons et conflits
+              (code -> noms trouvés par fichier)
+    """
+    seen = {}
+    for path in sorted(paths):
+        if path.endswith(".jsonl"):
+            entries = ((record["code"], record["formation_names"]) for record in iter_records(path))
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = json.load(f).items()
+        # Dans un même fichier, la dernière ligne d'un code fait foi
+        for code, names in dict((int(code), names) for code, names in entries).items():
+            if names:
+                seen.setdefault(code, {})[path] = sorted(names)
+
+    formations, duplicates, conflicts = {}, [], {}
+    for code in sorted(seen):
+        by_path = seen[code]
+        if len(by_path) > 1:
+            duplicates.append(code)
+            if len({tuple(names) for names in by_path.values()}) > 1:
+                conflicts[code] = by_path
+        formations[str(code)] = sorted({name for names in by_path.values() for name in names})
+
+    write_json_atomic(output, formations)
+    return {"formations": len(formations), "duplicates": duplicates, "conflicts": conflicts}
+
+
+def parse_shard(text):
+    """Analyse `i/N` (shard i parmi N, à partir de 0)."""
+    index, count = (int(part) for part in text.split("/", 1))
+    if not 0 <= index < count:
+        raise ValueError(f"Shard invalide: {text}")
+    return index, count
+
+
+def shard_codes(codes, index, count):
+    """
+    Codes du shard `index` parmi `count`. Le partage est entrelacé (code
+    modulo `count`) pour que les zones denses de l'espace des codes soient
+    réparties entre les shards.
+    """
+    return (code for code in codes if code % count == index)
+
+
+def shard_path(path, index, count):
+    """Chemin propre à un shard (`formations.json` -> `formations.shard-0-of-4.json`)."""
+    base, ext = os.path.splitext(path)
+    return f"{base}.shard-{index}-of-{count}{ext}"
+
+
+def pending_codes(codes, records, retry_errors=False):
+    """
+    Codes qui restent à sonder, produits à la demande.
+
+    Args:
+        codes: Plage de codes demandée
+        records (JournalStatus): Journal relu par `ScanJournal.load`
+        retry_errors (bool): Ne garde que les codes dont le dernier sondage a échoué
+
+    Returns:
+        iterator: Codes à sonder, dans l'ordre de `codes`
+    """
+    if retry_errors:
+        return (code for code in codes if records.get(code) == ERROR)
+    return (code for code in codes if records.get(code) not in (HIT, MISS))
+
+
+def parse_code_range(text):
+    """
+    Analyse une plage de codes de la ligne de commande, sans la matérialiser.
+
+    Exemples: "0-30000", "14629", "100-200,500-600".
+
+    Returns:
+        iterator: Les codes de la plage, dans l'ordre
+    """
+    for part in text.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-", 1)
+            yield from range(int(first), int(last) + 1)
+        elif part:
+            yield int(part)
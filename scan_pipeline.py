@@ -0,0 +1,107 @@
+"""
+Pipeline du scan : téléchargement et analyse des calendriers en deux étapes.
+
+Les téléchargements (attente réseau) tournent dans de nombreux threads ; les
+calendriers reçus passent ensuite à un pool de processus qui en tire les
+noms de formation, sans disputer le GIL aux threads réseau. Les deux étapes
+sont reliées par une file bornée : quand l'analyse prend du retard, plus
+aucun téléchargement n'est lancé jusqu'à ce que la file se vide.
+"""
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+
+# Marqueur de fin du flux d'éléments
+_END = object()
+
+
+class StageStats:
+    """Compteur d'éléments traités par une étape, et débit depuis le démarrage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.started = time.monotonic()
+
+    def record(self):
+        self.count += 1
+
+    def throughput(self):
+        return self.count / max(time.monotonic() - self.started, 1e-9)
+
+
+class ScanPipeline:
+    """
+    Enchaîne une étape réseau et une étape de calcul.
+
+    `fetch(item)` tourne dans `fetch_executor` (threads) et retourne un
+    résultat ; si `needs_parse(résultat)` est vrai, `parse(résultat)` est
+    soumis à `parse_executor` (processus, `parse` doit donc être une fonction
+    de module), sinon le résultat est rendu tel quel.
+
+    Args:
+        fetch_executor: Exécuteur de l'étape réseau
+        parse_executor: Exécuteur de l'étape de calcul
+        fetch: Fonction de l'étape réseau
+        parse: Fonction de l'étape de calcul
+        needs_parse: Indique si un résultat de `fetch` doit être analysé
+        max_in_flight: Nombre maximal de téléchargements en cours (entier ou
+            fonction sans argument, voir `AdaptiveConcurrency.limit`)
+        max_queued: Nombre maximal de résultats en attente d'analyse ou en
+            cours d'analyse
+    """
+
+    def __init__(self, fetch_executor, parse_executor, fetch, parse, needs_parse, max_in_flight, max_queued):
+        self.fetch_executor = fetch_executor
+        self.parse_executor = parse_executor
+        self.fetch = fetch
+        self.parse = parse
+        self.needs_parse = needs_parse
+        self.limit = max_in_flight if callable(max_in_flight) else (lambda: max_in_flight)
+        self.max_queued = max_queued
+        self.fetched = StageStats("téléchargement")
+        self.parsed = StageStats("analyse")
+        self.fetching = {}
+        self.parsing = {}
+
+    @property
+    def queued(self):
+        """Nombre de résultats en attente d'analyse ou en cours d'analyse."""
+        return len(self.parsing)
+
+    def run(self, items):
+        """
+        Traite les éléments à la demande et rend les couples (élément, future
+        du résultat final) dans l'ordre d'achèvement. La mémoire reste bornée
+        quelle que soit la taille de `items`.
+        """
+        items = iter(items)
+        exhausted = False
+        while True:
+            # Contre-pression : pas de nouveau téléchargement tant que la file d'analyse est pleine
+            while not exhausted and len(self.fetching) < self.limit() and len(self.parsing) < self.max_queued:
+                item = next(items, _END)
+                if item is _END:
+                    exhausted = True
+                else:
+                    self.fetching[self.fetch_executor.submit(self.fetch, item)] = item
+            if not self.fetching and not self.parsing:
+                return
+            done, _ = wait(list(self.fetching) + list(self.parsing), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in self.parsing:
+                    self.parsed.record()
+                    yield self.parsing.pop(future), future
+                    continue
+                item = self.fetching.pop(future)
+                self.fetched.record()
+                if future.exception() is None and self.needs_parse(future.result()):
+                    self.parsing[self.parse_executor.submit(self.parse, future.result())] = item
+                else:
+                    yield item, future
+
+    def summary(self):
+        """Débit de chaque étape et remplissage de la file d'analyse."""
+        return " - ".join(
+            [f"{stage.name.capitalize()}: {stage.throughput():.1f} codes/s" for stage in (self.fetched, self.parsed)]
+            + [f"File d'analyse: {self.queued}/{self.max_queued}"]
+        )